@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+import numpy as np
+from CorpusStore import CorpusReader
+from SearchCursor import encode_cursor, decode_cursor
+
+# Tokens of StandardAnalyzer approximated by words joined with inner apostrophes or dots, lowercased
+TOKEN_REGEX = re.compile(r"\w+(?:['’.]\w+)*")
+
+# Field lengths are stored lossily in one byte like Lucene norms (SmallFloat.intToByte4), so scores match Lucene
+NUM_FREE_NORM_VALUES = 24
+
+
+# Returns tokens of the text, as indexed and searched
+# @param text <str>: analyzed text
+def tokenize(text):
+    return TOKEN_REGEX.findall(text.lower())
+
+# Returns 64-bit hash of the term, used as the key of the on-disk term dictionary
+# @param term <bytes>: UTF-8 encoded term
+def hash_term(term):
+    return int.from_bytes(hashlib.blake2b(term, digest_size=8).digest(), "little")
+
+# Encodes non-negative integer into 4 bits, 3 of mantissa and 1 of exponent (SmallFloat.longToInt4)
+def long_to_int4(value):
+    num_bits = value.bit_length()
+    if num_bits < 4:
+        return value
+
+    shift = num_bits - 4
+    return (value >> shift) & 0x07 | (shift + 1) << 3
+
+# Decodes integer encoded by long_to_int4 (SmallFloat.int4ToLong)
+def int4_to_long(value):
+    bits, shift = value & 0x07, (value >> 3) - 1
+    return bits if shift == -1 else (bits | 0x08) << shift
+
+# Encodes field length into a norm byte (SmallFloat.intToByte4)
+# @param length <int>: number of tokens of the field
+def length_to_norm(length):
+    if length < NUM_FREE_NORM_VALUES:
+        return length
+    return NUM_FREE_NORM_VALUES + long_to_int4(length - NUM_FREE_NORM_VALUES)
+
+# Decodes field length from a norm byte (SmallFloat.byte4ToInt)
+# @param norm <int>: norm byte
+def norm_to_length(norm):
+    if norm < NUM_FREE_NORM_VALUES:
+        return norm
+    return min(NUM_FREE_NORM_VALUES + int4_to_long(norm - NUM_FREE_NORM_VALUES), 2 ** 31 - 1)
+
+# Lengths represented by every norm byte
+LENGTH_TABLE = np.array([norm_to_length(norm) for norm in range(256)], dtype=np.float64)
+
+# Writes strings as one UTF-8 blob and offsets of the strings in it
+# @param path <str>: path prefix of the two files
+# @param strings <list>: written strings
+def write_strings(path, strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    np.save(f"{path}.offsets.npy", np.cumsum([0] + [len(string) for string in encoded], dtype=np.int64))
+    np.save(f"{path}.blob.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+
+# BM25 index class -> JVM-free search backend with the search API of Indexer; every field has its own inverted index
+# of NumPy arrays saved as .npy files, which are memory-mapped on open, so opening an index takes milliseconds
+#   {field}.terms.*      UTF-8 terms sorted by their 64-bit hashes, looked up by binary search of the hashes
+#   {field}.hashes.npy   sorted hashes of the terms
+#   {field}.postings.npy start of the postings of every term, postings of term i are [start[i], start[i + 1])
+#   {field}.docs.npy     document numbers of all postings
+#   {field}.freqs.npy    term frequencies of all postings
+#   {field}.norms.npy    field length of every document encoded in a byte
+#   titles.*             titles of the documents
+# Documents are scored by Lucene's BM25 (k1=1.2, b=0.75); keywords are analyzed into terms, all terms of a clause are
+# optional like in QueryParser, but query syntax (phrases, wildcards, fields inside keywords) is not supported
+class BM25Index:
+    K1 = 1.2
+    B = 0.75
+    # Separator of the clauses and whether all clauses are required, for every search mode
+    MODES = {"AND": (" AND ", True), "OR": (" OR ", False)}
+
+    # Builds an index of the corpus file
+    # @param path_to_parsed_data <str>: corpus file written by DataMerger; e.g. "merged.arrow"
+    # @param index_directory <str>: output directory; e.g. "bm25_index"
+    # @param columns <list>: columns to index; None indexes all of them
+    # @return <BM25Index>: the opened index
+    @classmethod
+    def build(cls, path_to_parsed_data, index_directory="bm25_index", columns=None):
+        os.makedirs(index_directory, exist_ok=True)
+
+        with CorpusReader(path_to_parsed_data) as reader:
+            fields = columns if columns is not None else reader.columns
+            postings = {field: defaultdict(list) for field in fields}
+            lengths = {field: [] for field in fields}
+            titles = []
+
+            for doc, row in enumerate(reader.iter_rows(fields)):
+                values = dict(zip(fields, row))
+                titles.append(values.get("Title") or "")
+                for field in fields:
+                    tokens = tokenize(values[field] or "")
+                    lengths[field].append(len(tokens))
+                    for term, freq in Counter(tokens).items():
+                        postings[field][term].append((doc, freq))
+
+        meta = {"num_docs": len(titles), "fields": {}}
+        for field in fields:
+            encoded_terms = {term.encode("utf-8"): term for term in postings[field]}
+            terms = sorted(encoded_terms, key=hash_term)
+            term_postings = [postings[field][encoded_terms[term]] for term in terms]
+
+            path = os.path.join(index_directory, field)
+            np.save(f"{path}.hashes.npy", np.array([hash_term(term) for term in terms], dtype=np.uint64))
+            write_strings(f"{path}.terms", [encoded_terms[term] for term in terms])
+            np.save(f"{path}.postings.npy",
+                    np.cumsum([0] + [len(term_posting) for term_posting in term_postings], dtype=np.int64))
+            np.save(f"{path}.docs.npy", np.array([doc for term_posting in term_postings for doc, _ in term_posting],
+                                                 dtype=np.int32))
+            np.save(f"{path}.freqs.npy", np.array([freq for term_posting in term_postings for _, freq in term_posting],
+                                                  dtype=np.float32))
+            np.save(f"{path}.norms.npy", np.array([length_to_norm(length) for length in lengths[field]],
+                                                  dtype=np.uint8))
+
+            # Like Lucene, documents without any term of the field don't count into the field statistics
+            meta["fields"][field] = {
+                "doc_count": sum(1 for length in lengths[field] if length > 0),
+                "sum_total_term_freq": sum(lengths[field]),
+            }
+
+        write_strings(os.path.join(index_directory, "titles"), titles)
+        with open(os.path.join(index_directory, "meta.json"), "w", encoding="utf-8") as meta_file:
+            json.dump(meta, meta_file)
+
+        return cls(index_directory)
+
+    # Opens an index built by build
+    # @param index_directory <str>: directory with the index; e.g. "bm25_index"
+    def __init__(self, index_directory="bm25_index"):
+        self.index_directory = index_directory
+        with open(os.path.join(index_directory, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+
+        self.num_docs = meta["num_docs"]
+        # Every build rewrites the metadata, its modification time identifies the version of the index for cursors
+        self.version = os.stat(os.path.join(index_directory, "meta.json")).st_mtime_ns
+        self.fields = {}
+        for field, statistics in meta["fields"].items():
+            path = os.path.join(index_directory, field)
+            arrays = {name: np.load(f"{path}.{name}.npy", mmap_mode="r")
+                      for name in ["hashes", "terms.offsets", "terms.blob", "postings", "docs", "freqs", "norms"]}
+            doc_count = statistics["doc_count"]
+            avgdl = statistics["sum_total_term_freq"] / doc_count if doc_count else 1.0
+            # BM25 length normalization of every norm byte, looked up per document
+            arrays["norm_cache"] = self.K1 * (1 - self.B + self.B * LENGTH_TABLE / avgdl)
+            arrays["doc_count"] = doc_count
+            self.fields[field] = arrays
+
+        self.title_offsets = np.load(os.path.join(index_directory, "titles.offsets.npy"), mmap_mode="r")
+        self.title_blob = np.load(os.path.join(index_directory, "titles.blob.npy"), mmap_mode="r")
+
+    # Returns number of the term in the field, or None if the field doesn't contain it
+    # @param field <dict>: arrays of the field
+    # @param term <str>: analyzed term
+    def find_term(self, field, term):
+        encoded = term.encode("utf-8")
+        term_hash = np.uint64(hash_term(encoded))
+        position = int(np.searchsorted(field["hashes"], term_hash))
+        # Terms with colliding hashes are adjacent
+        while position < len(field["hashes"]) and field["hashes"][position] == term_hash:
+            start, end = field["terms.offsets"][position], field["terms.offsets"][position + 1]
+            if field["terms.blob"][start:end].tobytes() == encoded:
+                return position
+            position += 1
+
+        return None
+
+    # Returns BM25 scores of all documents for one clause and mask of the documents matching it
+    # @param column <str>: searched field; e.g. "Title"
+    # @param keyword <str>: keywords of the clause; e.g. "Scalecommander Sarkareth"
+    def score_clause(self, column, keyword):
+        scores = np.zeros(self.num_docs, dtype=np.float64)
+        matches = np.zeros(self.num_docs, dtype=bool)
+        field = self.fields.get(column)
+        if field is None:
+            return scores, matches
+
+        for term in tokenize(keyword):
+            term_number = self.find_term(field, term)
+            if term_number is None:
+                continue
+
+            start, end = field["postings"][term_number], field["postings"][term_number + 1]
+            docs, freqs = field["docs"][start:end], field["freqs"][start:end]
+            doc_freq = end - start
+            idf = np.log(1 + (field["doc_count"] - doc_freq + 0.5) / (doc_freq + 0.5))
+            scores[docs] += idf * freqs / (freqs + field["norm_cache"][field["norms"][docs]])
+            matches[docs] = True
+
+        return scores, matches
+
+    # Returns title of the document
+    # @param doc <int>: number of the document
+    def get_title(self, doc):
+        return self.title_blob[self.title_offsets[doc]:self.title_offsets[doc + 1]].tobytes().decode("utf-8")
+
+    # Returns normalized clauses of the query, numbers of the matching documents and their scores
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param operator <str>: separator of the clauses; " AND " or " OR "
+    # @param require_all <bool>: documents have to match every clause, otherwise any clause
+    def match_documents(self, query, operator, require_all):
+        clauses = []
+        total_scores = np.zeros(self.num_docs, dtype=np.float64)
+        matches = np.full(self.num_docs, require_all)
+        for multi_query in query.split(operator):
+            column_to_search, keyword = multi_query.split(":")
+            clauses.append((column_to_search, " ".join(keyword.split())))
+            scores, clause_matches = self.score_clause(column_to_search, keyword)
+            total_scores += scores
+            matches = matches & clause_matches if require_all else matches | clause_matches
+
+        # Scores are compared in single precision like in Lucene
+        candidates = np.flatnonzero(matches)
+        return tuple(clauses), candidates, total_scores[candidates].astype(np.float32)
+
+    # Returns positions of the best candidates ordered by score, ties are broken by document order
+    # @param candidates <ndarray>: numbers of the matching documents
+    # @param candidate_scores <ndarray>: scores of the candidates
+    # @param number_of_results <int>: number of returned positions
+    def rank_candidates(self, candidates, candidate_scores, number_of_results):
+        selected = np.arange(len(candidates))
+        if 0 < number_of_results < len(candidates):
+            # Keeps only candidates scoring at least the k-th best score, all documents tied with it included
+            kth_score = -np.partition(-candidate_scores, number_of_results - 1)[number_of_results - 1]
+            selected = selected[candidate_scores >= kth_score]
+
+        return selected[np.lexsort((candidates[selected], -candidate_scores[selected]))][:number_of_results]
+
+    # Executes boolean query built from the clauses of the query
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param number_of_results <int>: maximal number of returned results
+    # @param operator <str>: separator of the clauses; " AND " or " OR "
+    # @param require_all <bool>: documents have to match every clause, otherwise any clause
+    def search(self, query, number_of_results, operator, require_all):
+        if number_of_results < 0:
+            return None
+
+        if query == "":
+            return None
+
+        _, candidates, candidate_scores = self.match_documents(query, operator, require_all)
+        ranking = self.rank_candidates(candidates, candidate_scores, number_of_results)
+
+        return [(counter, self.get_title(candidates[i]), float(candidate_scores[i]))
+                for counter, i in enumerate(ranking, start=1)]
+
+    # Returns one page of results and the cursor of the next page, like Searcher.search_page
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param number_of_results <int>: number of results on the page
+    # @param mode <str>: "AND" or "OR"
+    # @param cursor <str>: token returned with the previous page; None for the first page
+    # @return <tuple>: (results, cursor of the next page or None after the last page); (None, None) for invalid input
+    def search_page(self, query, number_of_results, mode="AND", cursor=None):
+        if number_of_results < 0:
+            return None, None
+
+        if query == "":
+            return None, None
+
+        clauses, candidates, candidate_scores = self.match_documents(query, *self.MODES[mode])
+        rank = 0
+        if cursor is not None:
+            score, doc, rank = decode_cursor(cursor, self.version, (mode, clauses))
+            score = np.float32(score)
+            after = (candidate_scores < score) | ((candidate_scores == score) & (candidates > doc))
+            candidates, candidate_scores = candidates[after], candidate_scores[after]
+
+        ranking = self.rank_candidates(candidates, candidate_scores, number_of_results)
+        results = [(counter, self.get_title(candidates[i]), float(candidate_scores[i]))
+                   for counter, i in enumerate(ranking, start=rank + 1)]
+
+        next_cursor = None
+        if results and len(results) == number_of_results:
+            last = ranking[-1]
+            next_cursor = encode_cursor(self.version, (mode, clauses), float(candidate_scores[last]),
+                                        int(candidates[last]), rank + len(results))
+
+        return results, next_cursor
+
+    # Yields all results of the query lazily, (rank, title, score) one by one; documents are scored and ordered once,
+    # titles are read only for the consumed hits
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param mode <str>: "AND" or "OR"
+    def iter_hits(self, query, mode="AND"):
+        if query == "":
+            return
+
+        _, candidates, candidate_scores = self.match_documents(query, *self.MODES[mode])
+        for rank, i in enumerate(np.lexsort((candidates, -candidate_scores)), start=1):
+            yield rank, self.get_title(candidates[i]), float(candidate_scores[i])
+
+    # Search index
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    def search_documents_and(self, query, number_of_results):
+        return self.search(query, number_of_results, " AND ", require_all=True)
+
+    # Search index
+    # @param query <str>: Query for index; e.g. "Title:Illidan OR Wiki:fel"
+    def search_documents_or(self, query, number_of_results):
+        return self.search(query, number_of_results, " OR ", require_all=False)
+
+
+# Measures mean latency of the queries with both backends and how many of the top titles they share
+# @param queries <list>: (mode, query) pairs; e.g. [("AND", "Title:Ysera")]
+# @param number_of_results <int>: k of every query
+# @param repeat <int>: number of runs of every query
+# @param lucene_index_directory <str>: directory with the Lucene index, built with DEFAULT_SCHEMA
+# @param bm25_index_directory <str>: directory with the BM25 index
+def compare_backends(queries, number_of_results=10, repeat=20, lucene_index_directory="index",
+                     bm25_index_directory="bm25_index"):
+    from Indexer import Searcher
+
+    start_time = time.perf_counter()
+    bm25_index = BM25Index(bm25_index_directory)
+    print(f"BM25 index opened in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+    start_time = time.perf_counter()
+    lucene_searcher = Searcher(lucene_index_directory, cache_size=0)
+    print(f"Lucene index opened in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+    print(f"{'Query':<60}{'Lucene [ms]':>12}{'BM25 [ms]':>12}{'Overlap':>9}")
+    for mode, query in queries:
+        latencies, results = [], []
+        for backend in [lucene_searcher, bm25_index]:
+            search = backend.search_documents_and if mode == "AND" else backend.search_documents_or
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                result = search(query, number_of_results)
+            latencies.append((time.perf_counter() - start_time) / repeat * 1000)
+            results.append({title for _, title, _ in result or []})
+
+        overlap = len(results[0] & results[1]) / max(len(results[0]), 1)
+        print(f"{mode + ' ' + query:<60.60}{latencies[0]:>12.3f}{latencies[1]:>12.3f}{overlap:>9.0%}")
+
+
+if __name__ == "__main__":
+    # Usage: python BM25Index.py build <corpus_file> [index_directory]
+    #        python BM25Index.py compare <query_file> [lucene_index_directory] [index_directory]
+    if sys.argv[1] == "build":
+        start_time = time.perf_counter()
+        index = BM25Index.build(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else "bm25_index")
+        print(f"Indexed {index.num_docs} documents in {time.perf_counter() - start_time:.1f}s")
+    elif sys.argv[1] == "compare":
+        with open(sys.argv[2], encoding="utf-8") as query_file:
+            queries = [tuple(line.rstrip("\n").split("\t", 1)) for line in query_file if line.strip()]
+        compare_backends(queries, lucene_index_directory=sys.argv[3] if len(sys.argv) > 3 else "index",
+                         bm25_index_directory=sys.argv[4] if len(sys.argv) > 4 else "bm25_index")
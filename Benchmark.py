@@ -0,0 +1,266 @@
+import json
+import os
+import random
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from BM25Index import BM25Index
+from CorpusStore import CorpusWriter
+from Parser import Parser
+from ParserBenchmark import generate_pages, measure
+
+try:
+    from Indexer import Indexer, Searcher, get_index_size
+except ImportError:
+    Indexer = None
+
+# Benchmark settings, overridable by environment variables
+NUM_DOCUMENTS = int(os.environ.get("BENCHMARK_DOCUMENTS", 2000))
+CONCURRENCY = int(os.environ.get("BENCHMARK_CONCURRENCY", 8))
+REPEAT = int(os.environ.get("BENCHMARK_REPEAT", 20))
+# Allowed relative slowdown against the baseline before the run fails
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", 0.5))
+RESULTS_PATH = os.environ.get("BENCHMARK_RESULTS", "benchmark_results.json")
+# The baseline is specific to the machine, it is written only on request: BENCHMARK_UPDATE_BASELINE=1
+BASELINE_PATH = os.environ.get("BENCHMARK_BASELINE", "benchmark_baseline.json")
+UPDATE_BASELINE = os.environ.get("BENCHMARK_UPDATE_BASELINE", "") == "1"
+
+BENCHMARK_QUERIES = [
+    ("AND", "Title:Ysera"),
+    ("OR", "Title:Aberrus"),
+    ("AND", "Title:Sarkareth AND Paragraphs_content:Aberrus"),
+    ("OR", "Title:Sarkareth OR Wiki:Aberrus"),
+    ("AND", "Title:Ysera AND Paragraphs_content:green AND Lists_content:Eye"),
+    ("OR", "Title:Illidan OR Wiki:fel OR Paragraphs_content:demon"),
+]
+
+# Measured metrics by their names, (value, True if higher is better, noise floor)
+RESULTS = {}
+TEMP_DIR = None
+CORPUS_PATH = None
+
+
+# Writes a synthetic corpus resembling the merged World of Warcraft pages; word frequencies follow Zipf's law
+# @param path <str>: path to the output corpus file
+# @param num_documents <int>: number of generated documents
+# @param seed <int>: seed of the generator, the same seed gives the same corpus
+def generate_corpus(path, num_documents, seed=42):
+    generator = random.Random(seed)
+    names = ["Ysera", "Sarkareth", "Illidan", "Aberrus", "Alexstrasza", "Nozdormu", "Thrall", "Jaina", "Arthas",
+             "Sylvanas", "Deathwing", "Kalecgos", "Wrathion", "Malygos", "Anduin", "Varian"]
+    words = names + ["the", "of", "and", "dragon", "aspect", "green", "black", "fel", "demon", "raid", "boss", "loot",
+                     "mythic", "heroic", "crucible", "shadowed", "dream", "emerald", "nightmare", "flight", "eye",
+                     "scalecommander", "approach", "isles", "dragonflight", "legion", "horde", "alliance", "quest"]
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+
+    def text(length):
+        return " ".join(generator.choices(words, weights, k=length))
+
+    with CorpusWriter(path, ["Title", "Paragraphs_content", "Lists_content", "Wiki"]) as writer:
+        for number in range(num_documents):
+            title = f"{generator.choice(names)} {text(generator.randint(0, 3))} {number}".replace("  ", " ")
+            writer.write_row((title, text(generator.randint(50, 400)), text(generator.randint(0, 80)),
+                              text(generator.randint(0, 200)) if generator.random() < 0.5 else ""))
+
+# Records value of a metric
+# @param name <str>: name of the metric; e.g. "bm25.build_seconds"
+# @param value <float>: measured value
+# @param higher_is_better <bool>: larger values are improvements, e.g. throughput
+# @param noise_floor <float>: changes smaller than this absolute value are never regressions, so sub-millisecond
+#                             jitter of fast queries doesn't fail the run
+def record(name, value, higher_is_better=False, noise_floor=0.0):
+    RESULTS[name] = (float(value), higher_is_better, noise_floor)
+
+# Returns metrics which got worse than the baseline by more than the tolerance
+# @param results <dict>: current metrics, {name: {"value": float, "higher_is_better": bool, "noise_floor": float}}
+# @param baseline <dict>: baseline metrics in the same format
+# @param tolerance <float>: allowed relative slowdown; e.g. 0.5
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        value, baseline_value = result["value"], baseline[name]["value"]
+        if result["higher_is_better"]:
+            regressed = value < baseline_value / (1 + tolerance)
+        else:
+            regressed = value > baseline_value * (1 + tolerance)
+        if regressed and abs(value - baseline_value) > result["noise_floor"]:
+            regressions.append(f"{name}: {value:.4g} (baseline {baseline_value:.4g})")
+
+    return regressions
+
+# Measures latency of every benchmark query run repeat times one after another
+# @param search <function>: function taking (mode, query), returns the results
+# @param repeat <int>: number of runs of every query
+# @return <ndarray>: latencies in milliseconds
+def measure_latencies(search, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for mode, query in BENCHMARK_QUERIES:
+            start_time = time.perf_counter()
+            search(mode, query)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    return np.array(latencies)
+
+# Measures latency of the benchmark queries sent by concurrent clients and the throughput; the best of several
+# rounds is kept, so a busy machine doesn't make a single round look like a regression
+# @param search <function>: function taking (mode, query), returns the results
+# @param repeat <int>: number of runs of every query in a round
+# @param initializer <function>: called in every client thread before its first query
+# @param rounds <int>: number of measured rounds
+# @return <tuple>: (latencies in milliseconds, queries per second) of the fastest round
+def measure_concurrent_latencies(search, repeat, initializer=None, rounds=3):
+    def timed_search(request):
+        start_time = time.perf_counter()
+        search(*request)
+        return (time.perf_counter() - start_time) * 1000
+
+    requests = BENCHMARK_QUERIES * repeat
+    best = None
+    with ThreadPoolExecutor(CONCURRENCY, initializer=initializer) as executor:
+        for _ in range(rounds):
+            start_time = time.perf_counter()
+            latencies = np.array(list(executor.map(timed_search, requests)))
+            queries_per_second = len(requests) / (time.perf_counter() - start_time)
+            if best is None or queries_per_second > best[1]:
+                best = (latencies, queries_per_second)
+
+    return best
+
+# Returns size of the directory in bytes
+# @param directory <str>: measured directory
+def get_directory_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+# Generates the corpus and builds the indexes once for all benchmarks
+def setUpModule():
+    global TEMP_DIR, CORPUS_PATH
+    TEMP_DIR = tempfile.TemporaryDirectory()
+    CORPUS_PATH = os.path.join(TEMP_DIR.name, "merged.arrow")
+    generate_corpus(CORPUS_PATH, NUM_DOCUMENTS)
+
+    bm25_directory = os.path.join(TEMP_DIR.name, "bm25_index")
+    start_time = time.perf_counter()
+    BM25Index.build(CORPUS_PATH, bm25_directory)
+    record("bm25.build_seconds", time.perf_counter() - start_time, noise_floor=0.5)
+    record("bm25.index_bytes", get_directory_size(bm25_directory))
+
+    if Indexer is not None:
+        lucene_directory = os.path.join(TEMP_DIR.name, "index")
+        indexer = Indexer(index_directory=lucene_directory)
+        start_time = time.perf_counter()
+        indexer.index_data(CORPUS_PATH, num_threads=os.cpu_count(), force_merge_segments=1)
+        record("lucene.build_seconds", time.perf_counter() - start_time, noise_floor=0.5)
+        record("lucene.index_bytes", get_index_size(lucene_directory))
+
+# Writes the results and fails the run if any metric regressed against the baseline; the run also fails if there is
+# no baseline, unless it was asked to store its results as the new baseline
+def tearDownModule():
+    TEMP_DIR.cleanup()
+
+    results = {name: {"value": value, "higher_is_better": higher_is_better, "noise_floor": noise_floor}
+               for name, (value, higher_is_better, noise_floor) in sorted(RESULTS.items())}
+    with open(RESULTS_PATH, "w", encoding="utf-8") as results_file:
+        json.dump(results, results_file, indent=2)
+
+    if UPDATE_BASELINE:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        return
+    if not os.path.exists(BASELINE_PATH):
+        raise AssertionError(f"Baseline {BASELINE_PATH} is missing, "
+                             f"run the benchmarks with BENCHMARK_UPDATE_BASELINE=1 to create it")
+
+    with open(BASELINE_PATH, encoding="utf-8") as baseline_file:
+        regressions = find_regressions(results, json.load(baseline_file), TOLERANCE)
+    if regressions:
+        raise AssertionError("Performance regressed against the baseline:\n" + "\n".join(regressions))
+
+
+# This class benchmarks searching with the BM25 backend
+class TestBM25Benchmark(unittest.TestCase):
+
+    # Opens the index built by setUpModule
+    @classmethod
+    def setUpClass(cls):
+        start_time = time.perf_counter()
+        cls.index = BM25Index(os.path.join(TEMP_DIR.name, "bm25_index"))
+        record("bm25.open_ms", (time.perf_counter() - start_time) * 1000, noise_floor=5.0)
+
+    # Runs the query with the BM25 backend
+    def search(self, mode, query):
+        if mode == "OR":
+            return self.index.search_documents_or(query, 10)
+        return self.index.search_documents_and(query, 10)
+
+    # Benchmark of queries executed one after another
+    def test_single_query_latency(self):
+        self.assertTrue(self.search(*BENCHMARK_QUERIES[0]))
+        latencies = measure_latencies(self.search, REPEAT)
+        record("bm25.query_p50_ms", np.percentile(latencies, 50), noise_floor=1.0)
+        record("bm25.query_p99_ms", np.percentile(latencies, 99), noise_floor=2.0)
+
+    # Benchmark of queries executed by concurrent clients
+    def test_concurrent_query_latency(self):
+        latencies, queries_per_second = measure_concurrent_latencies(self.search, 5 * REPEAT)
+        record("bm25.concurrent_p50_ms", np.percentile(latencies, 50), noise_floor=1.0)
+        record("bm25.concurrent_p99_ms", np.percentile(latencies, 99), noise_floor=10.0)
+        record("bm25.concurrent_qps", queries_per_second, higher_is_better=True)
+
+
+# This class benchmarks searching with the Lucene backend
+@unittest.skipIf(Indexer is None, "PyLucene is not installed")
+class TestLuceneBenchmark(unittest.TestCase):
+
+    # Opens the index built by setUpModule, the result cache is disabled so every query is executed
+    @classmethod
+    def setUpClass(cls):
+        start_time = time.perf_counter()
+        cls.searcher = Searcher(os.path.join(TEMP_DIR.name, "index"), cache_size=0)
+        record("lucene.open_ms", (time.perf_counter() - start_time) * 1000, noise_floor=5.0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.searcher.close()
+
+    # Runs the query with the Lucene backend
+    def search(self, mode, query):
+        if mode == "OR":
+            return self.searcher.search_documents_or(query, 10)
+        return self.searcher.search_documents_and(query, 10)
+
+    # Benchmark of queries executed one after another
+    def test_single_query_latency(self):
+        self.assertTrue(self.search(*BENCHMARK_QUERIES[0]))
+        latencies = measure_latencies(self.search, REPEAT)
+        record("lucene.query_p50_ms", np.percentile(latencies, 50), noise_floor=1.0)
+        record("lucene.query_p99_ms", np.percentile(latencies, 99), noise_floor=2.0)
+
+    # Benchmark of queries executed by concurrent clients attached to the JVM
+    def test_concurrent_query_latency(self):
+        latencies, queries_per_second = measure_concurrent_latencies(self.search, 5 * REPEAT,
+                                                                     initializer=Indexer.attach_current_thread)
+        record("lucene.concurrent_p50_ms", np.percentile(latencies, 50), noise_floor=1.0)
+        record("lucene.concurrent_p99_ms", np.percentile(latencies, 99), noise_floor=10.0)
+        record("lucene.concurrent_qps", queries_per_second, higher_is_better=True)
+
+
+# This class benchmarks parsing of the crawled pages
+class TestParserBenchmark(unittest.TestCase):
+
+    # Benchmark of parsing whole synthetic wiki pages into title, paragraphs and lists
+    def test_parse_page_throughput(self):
+        parser = Parser()
+        pages = generate_pages(500)
+        self.assertEqual(parser.parse_page(pages[0])[0], "Ysera 0")
+        record("parser.parse_pages_per_second", measure(parser.parse_page, pages, repeat=3), higher_is_better=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
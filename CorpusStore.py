@@ -0,0 +1,148 @@
+import csv
+import sys
+import pyarrow as pa
+
+
+# Corpus writer class -> writes a table of text columns into an Arrow IPC file, the columnar format shared by Parser,
+# DataMerger and Indexer; rows are buffered and written as record batches (row groups) of row_group_size rows
+class CorpusWriter:
+
+    # Constructor
+    # @param path <str>: path to the output file; e.g. "parsed.arrow"
+    # @param columns <list>: names of the columns; e.g. ["Title", "Paragraphs_content", "Lists_content"]
+    # @param row_group_size <int>: number of rows in one record batch
+    # @param compression <str>: buffer compression, "zstd" or "lz4"; None keeps columns uncompressed, which makes
+    #                           column access through a memory map zero-copy
+    def __init__(self, path, columns, row_group_size=1000, compression="zstd"):
+        self.schema = pa.schema([(column, pa.string()) for column in columns])
+        self.row_group_size = row_group_size
+        self.sink = pa.OSFile(path, "wb")
+        self.writer = pa.ipc.new_file(self.sink, self.schema,
+                                      options=pa.ipc.IpcWriteOptions(compression=compression))
+        self.buffer = []
+        self.batches_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    # Appends one row and returns its location (batch number, row number in the batch) for CorpusReader.read_row
+    # @param row <tuple>: values of the row in the order of the columns
+    def write_row(self, row):
+        location = (self.batches_written, len(self.buffer))
+        self.buffer.append(row)
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+        return location
+
+    # Appends rows
+    # @param rows <iterable>: rows, each with values in the order of the columns
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    # Appends a pandas DataFrame having all the columns as one or more record batches
+    # @param data_frame <DataFrame>: rows to append
+    def write_data_frame(self, data_frame):
+        self.flush()
+        table = pa.Table.from_pandas(data_frame[self.schema.names], schema=self.schema, preserve_index=False)
+        for batch in table.to_batches(max_chunksize=self.row_group_size):
+            self.writer.write_batch(batch)
+            self.batches_written += 1
+
+    # Writes the buffered rows as one record batch
+    def flush(self):
+        if not self.buffer:
+            return
+
+        columns = [pa.array(values, pa.string()) for values in zip(*self.buffer)]
+        self.writer.write_batch(pa.record_batch(columns, schema=self.schema))
+        self.batches_written += 1
+        self.buffer = []
+
+    # Writes the buffered rows and closes the file
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.sink.close()
+
+
+# Corpus reader class -> reads an Arrow IPC corpus file through a memory map; record batches are streamed one by one
+# and only the requested columns are read, uncompressed columns are accessed without copying
+class CorpusReader:
+
+    # Constructor
+    # @param path <str>: path to the corpus file; e.g. "merged.arrow"
+    def __init__(self, path):
+        self.source = pa.memory_map(path, "r")
+        self.reader = pa.ipc.open_file(self.source)
+        self.columns = self.reader.schema.names
+        self.cached_batch = (None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    # Returns number of record batches in the file
+    def num_batches(self):
+        return self.reader.num_record_batches
+
+    # Returns reader of the file reading only given columns
+    # @param columns <list>: names of columns to read; None reads all of them
+    def projected_reader(self, columns=None):
+        if columns is None:
+            return self.reader
+        included_fields = [self.columns.index(column) for column in columns]
+        return pa.ipc.open_file(self.source, options=pa.ipc.IpcReadOptions(included_fields=included_fields))
+
+    # Generator yielding record batches having only given columns, in the given order; the projected reader returns
+    # them in the order of the file, so every batch is reordered without copying the columns
+    # @param columns <list>: names of columns to read; None reads all of them
+    def iter_batches(self, columns=None):
+        reader = self.projected_reader(columns)
+        for batch_number in range(reader.num_record_batches):
+            batch = reader.get_batch(batch_number)
+            yield batch.select(columns) if columns is not None else batch
+
+    # Generator yielding rows as tuples of values of given columns
+    # @param columns <list>: names of columns to read; None reads all of them
+    def iter_rows(self, columns=None):
+        for batch in self.iter_batches(columns):
+            yield from zip(*[column.to_pylist() for column in batch.columns])
+
+    # Returns whole column as an Arrow ChunkedArray
+    # @param column <str>: name of the column; e.g. "Title"
+    def read_column(self, column):
+        return pa.chunked_array([batch.column(0) for batch in self.iter_batches([column])], pa.string())
+
+    # Returns one row as a tuple of values of all columns; the last read batch is kept, so reading rows in order
+    # decodes every batch only once
+    # @param batch_number <int>: number of the record batch
+    # @param row_number <int>: number of the row in the batch
+    def read_row(self, batch_number, row_number):
+        if self.cached_batch[0] != batch_number:
+            batch = self.reader.get_batch(batch_number)
+            self.cached_batch = (batch_number, batch, [column.to_pylist() for column in batch.columns])
+        return tuple(column[row_number] for column in self.cached_batch[2])
+
+    # Closes the memory map
+    def close(self):
+        self.cached_batch = (None, None, None)
+        self.source.close()
+
+
+# Converts a TSV file with a header, e.g. parsed.tsv or merged.tsv of older runs, into a corpus file
+if __name__ == "__main__":
+    csv.field_size_limit(sys.maxsize)
+    tsv_path, corpus_path = sys.argv[1], sys.argv[2]
+
+    with open(tsv_path, "r", encoding="utf-8") as tsv_file:
+        reader = csv.reader(tsv_file, delimiter="\t")
+        with CorpusWriter(corpus_path, next(reader)) as writer:
+            writer.write_rows(reader)
+
+    print(f"Converted {tsv_path} into {corpus_path}")
@@ -0,0 +1,47 @@
+import sqlite3
+
+
+# Crawl state class -> SQLite database underlying the stores of the crawl state, Frontier and PageCache; keeps named
+# values like the page counter and the change log of the current crawl (pages found new, changed or deleted), which
+# the crawler writes into the manifest; nothing is committed here, each store commits its database on its own
+# checkpoints, so the change log is persisted together with the state it was recorded with
+class CrawlState:
+
+    # Constructor
+    # @param path <str>: path to the SQLite file; e.g. "crawl_state.sqlite"; ":memory:" keeps the state in memory only
+    def __init__(self, path):
+        self.database = sqlite3.connect(path)
+        self.database.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS changes (url TEXT PRIMARY KEY, title TEXT, page_key TEXT, status TEXT);
+        """)
+
+    # Returns value stored under given key, or default if there is none
+    # @param key <str>: name of the value; e.g. "counter"
+    def get_meta(self, key, default=None):
+        row = self.database.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    # Stores a value under given key
+    # @param key <str>: name of the value; e.g. "counter"
+    # @param value <object>: value convertible to string
+    def set_meta(self, key, value):
+        self.database.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # Records a new, changed or deleted page of the current crawl for the manifest; a page is recorded only once
+    # @param url <str>: normalized relative url; e.g. "/wiki/Ysera"
+    # @param title <str>: main title of the page
+    # @param page_key <str>: key of the page in the page store
+    # @param status <str>: "new", "changed" or "deleted"
+    def add_change(self, url, title, page_key, status):
+        self.database.execute("INSERT OR IGNORE INTO changes (url, title, page_key, status) VALUES (?, ?, ?, ?)",
+                              (url, title, page_key, status))
+
+    # Returns recorded changes of the current crawl as (url, title, page_key, status) tuples in the order of recording
+    def get_changes(self):
+        return [tuple(row) for row in
+                self.database.execute("SELECT url, title, page_key, status FROM changes ORDER BY rowid")]
+
+    # Forgets changes recorded by the previous crawl
+    def clear_changes(self):
+        self.database.execute("DELETE FROM changes")
@@ -1,89 +1,323 @@
 import requests
 import re
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from Frontier import Frontier
+from PageCache import PageCache
+from PageStore import PageStore
+from DuplicateDetector import NearDuplicateDetector
+from HtmlExtractor import HtmlExtractor
+
+
+# Rate limiter class -> keeps a minimal delay between two requests sent to the same host, shared by all threads
+class HostRateLimiter:
+
+    # Constructor
+    # @param requests_per_second <float>: maximal number of requests per second sent to one host; e.g. 5; None disables limiting
+    def __init__(self, requests_per_second=None):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_allowed = {}
+        self.lock = threading.Lock()
+
+    # Blocks the calling thread until a request to the host of given url is allowed
+    # Every caller reserves its own time slot, so concurrent threads never send two requests within min_interval
+    # @param url <str>: url the request will be sent to; e.g. "https://warcraft.wiki.gg/wiki/Ysera"
+    def wait(self, url):
+        if not self.min_interval:
+            return
+
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_allowed.get(host, now))
+            self.next_allowed[host] = slot + self.min_interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
 
 # Crawler class -> one instance suits as one crawler
 class Crawler:
 
     # Constructor
     # @param num_pages_to_download <int>: number of pages to download; e.g. 15000
-    # @param save_html_path <str>: path to directory, where downloaded HTML files should be saved; e.g. "crawled_data"
+    # @param save_html_path <str>: path to directory of the page store, where downloaded HTML is saved; e.g. "crawled_data"
     # @param root_url <str>: root starting URL to start crawling; e.g. "https://warcraft.wiki.gg"
     # @param starting_url <str>: relative URL address to root_url the crawling; e.g. "/wiki/World_of_Warcraft:_Dragonflight"
-    def __init__(self, num_pages_to_download, save_html_path, root_url="", starting_url=""):
+    # @param num_workers <int>: maximal number of requests in flight at once; e.g. 8; 1 downloads pages one by one
+    # @param requests_per_second <float>: per-host rate limit; e.g. 10; None means no limit
+    # @param max_retries <int>: number of retries of a failed request (connection errors, 429 and 5xx responses)
+    # @param backoff_factor <float>: exponential backoff between retries in seconds; e.g. 0.5 -> 0.5s, 1s, 2s, ...
+    # @param request_timeout <float>: timeout of one request in seconds
+    # @param state_path <str>: SQLite file the crawl state is checkpointed to; e.g. "crawl_state.sqlite"; an existing state is resumed
+    # @param checkpoint_interval <int>: number of saved pages between two checkpoints of the crawl state
+    # @param cache_path <str>: SQLite page cache enabling incremental re-crawl; e.g. "page_cache.sqlite"; None downloads everything
+    # @param manifest_path <str>: TSV file listing new and changed pages of this crawl; e.g. "changed_pages.tsv"; None writes none
+    # @param near_duplicate_threshold <float>: SimHash similarity from which a page is skipped as a near-duplicate of
+    #                                          an already saved page; e.g. 0.95; None disables the detection
+    # @param expand_near_duplicates <bool>: whether links found on skipped near-duplicate pages are still crawled
+    def __init__(self, num_pages_to_download, save_html_path, root_url="", starting_url="", num_workers=1,
+                 requests_per_second=None, max_retries=3, backoff_factor=0.5, request_timeout=30, state_path=None,
+                 checkpoint_interval=100, cache_path=None, manifest_path=None, near_duplicate_threshold=None,
+                 expand_near_duplicates=True):
         self.SAVE_HTML_PATH = save_html_path
         self.ROOT_URL = root_url
-        self.visited_urls = []
-        self.unvisited_urls = [starting_url]
+        self.page_store = PageStore(save_html_path)
+        self.frontier = Frontier(starting_url, state_path, checkpoint_interval)
+        self.cache = PageCache(cache_path) if cache_path is not None else None
+        self.manifest_path = manifest_path
+        # Changes are committed together with the state they depend on: the cache if there is one, else the frontier
+        self.change_log = self.cache if self.cache is not None else self.frontier
+        self.checked_pages = 0
         self.num_pages_to_download = num_pages_to_download
-        self.used_titles = []
-        self.counter = 0
+        self.duplicate_detector = None
+        if near_duplicate_threshold is not None:
+            self.duplicate_detector = NearDuplicateDetector(near_duplicate_threshold)
+        self.expand_near_duplicates = expand_near_duplicates
+
+        # Resuming a finished crawl would send no request at all; with a cache, a finished crawl is therefore followed
+        # by a new one from the starting url, which re-checks the cached pages with conditional requests
+        finished = self.frontier.get_meta("finished")
+        if finished == "1" and self.cache is not None:
+            self.frontier.reset(starting_url)
+        if finished != "0":
+            self.change_log.clear_changes()
+        self.frontier.set_meta("finished", 0)
+        self.frontier.checkpoint(force=True)
+        if self.cache is not None:
+            self.cache.commit()
+
+        # New pages must not overwrite pages saved by previous crawls, so the counter continues after them
+        self.counter = int(self.frontier.get_meta("counter", 0))
+        if self.cache is not None:
+            self.counter = max(self.counter, int(self.cache.get_meta("counter", 0)))
+
+        self.num_workers = max(1, num_workers)
+        self.request_timeout = request_timeout
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.session = self.create_session(max_retries, backoff_factor)
 
         self.crawl()
 
+    # Creates a session shared by all worker threads; its connection pool keeps TCP/TLS connections alive
+    # and retries failed requests with exponential backoff (honouring Retry-After headers)
+    # @param max_retries <int>: number of retries of a failed request
+    # @param backoff_factor <float>: exponential backoff between retries in seconds
+    def create_session(self, max_retries, backoff_factor):
+        retry = Retry(total=max_retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.num_workers, pool_maxsize=self.num_workers, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     # Sends a request to given url and returns response from server
     # @param url <str>: url to send request to; e.g. "https://warcraft.wiki.gg"
-    def download_url(self, url):
-        return requests.get(url)
+    # @param cached_page <dict>: cached information about the page; if given, the request is conditional and
+    #                            the server answers 304 Not Modified without a body when the page has not changed
+    def download_url(self, url, cached_page=None):
+        headers = {}
+        if cached_page is not None:
+            if cached_page["etag"]:
+                headers["If-None-Match"] = cached_page["etag"]
+            if cached_page["last_modified"]:
+                headers["If-Modified-Since"] = cached_page["last_modified"]
 
-    # Given an HTML document, finds and returns main title of the page's content
-    # @param document <str>: HTML document
-    def get_main_title(self, document):
-        main_title = re.search(r"<span\s+class\s*=\s*[\"\']mw-page-title-main[\"\']>([^<>]+)</span>", document, flags=re.I | re.M | re.DOTALL)
+        self.rate_limiter.wait(url)
+        return self.session.get(url, headers=headers, timeout=self.request_timeout)
 
-        if main_title is None:
-            main_title = re.search(r"<h1\s+[^>)]*id=[\"\']firstHeading[\"\'][^>]*>(.*?)<\/h1>", document, flags=re.I | re.M | re.DOTALL).groups()[0]
-            main_title = re.sub(r"<.*?>","", main_title, flags=re.I | re.M | re.DOTALL)
-            return main_title
+    # Downloads relative link in a worker thread and, if the response is a page (200), extracts its content, hashes it
+    # and fingerprints it there too, so the pages of a batch are processed concurrently rather than on the main thread
+    # Returns (response, extracted page, content hash, fingerprint), the last three are None for other responses and
+    # the fingerprint also without near-duplicate detection; returns None if the request failed even after retries
+    # @param relative_link <str>: url relative to root_url; e.g. "/wiki/Ysera"
+    # @param cached_page <dict>: cached information about the page or None
+    def fetch(self, relative_link, cached_page=None):
+        try:
+            response = self.download_url(self.ROOT_URL + relative_link, cached_page)
+        except requests.RequestException as error:
+            print(f"Failed to download {relative_link}: {error}\n")
+            return None
 
-        return main_title.groups()[0]
+        if response.status_code != 200:
+            return response, None, None, None
 
-    # Given a server response, saves the HTML to the saving directory
-    # @param page <Response>: response from server
-    def save_html(self, page):
-        page_title_tag = re.search("<title.*>.*</title>", page.text, flags= re.IGNORECASE | re.MULTILINE)
-        page_title = re.sub("<.*?>", "", page_title_tag.group())
-        page_title = re.sub(r'[/*?:"<>|]', "", page_title)
+        extracted_page = self.extract_page(response)
+        fingerprint = None
+        if self.duplicate_detector is not None:
+            fingerprint = self.duplicate_detector.fingerprint(response.text)
+        return response, extracted_page, self.content_hash(extracted_page), fingerprint
 
-        with open(f"{self.SAVE_HTML_PATH}/{page_title}_{self.counter}.html", "w", encoding="utf-8") as file:
-            file.write(page.text)
-            file.close()
+    # Given a server response, returns page title, main title of the page's content and all wiki links found
+    # within the HTML, extracted in one streaming pass over the document
+    # @param page <Response>: response from server
+    def extract_page(self, page):
+        return HtmlExtractor().extract(page.text)
 
-        self.counter += 1
+    # Given an extracted page, returns hash of its content (main title, paragraphs, lists and links); the raw body
+    # isn't hashed, as MediaWiki adds per-request data (wgRequestId, "served in" timings) to every response
+    # @param extracted_page <HtmlExtractor>: content extracted from the page
+    def content_hash(self, extracted_page):
+        parts = [extracted_page.main_title, *extracted_page.paragraphs, "\x1e", *extracted_page.lists, "\x1e",
+                 *extracted_page.links]
+        return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
 
-    # Given a server response, returns a list of all links found within the HTML
+    # Given a server response, saves the HTML to the page store and returns the key it was saved under
     # @param page <Response>: response from server
-    def find_links(self, page):
-        link_pattern = r"<a\s+href\s*=\s*[\"\'](/wiki/(?!(?:Forum:|User:|File:|Special:))[^\"\']+).*>.*</a>"
+    # @param relative_link <str>: url relative to root_url; e.g. "/wiki/Ysera"
+    # @param extracted_page <HtmlExtractor>: titles and links extracted from the page
+    # @param page_key <str>: key of the page to replace, e.g. of a changed page; None saves the page under a new key
+    def save_html(self, page, relative_link, extracted_page, page_key=None):
+        if page_key is None:
+            page_title = re.sub(r'[/*?:"<>|]', "", extracted_page.title)
+            page_key = f"{page_title}_{self.counter}"
+
+            self.counter += 1
+            self.frontier.set_meta("counter", self.counter)
+            if self.cache is not None:
+                self.cache.set_meta("counter", self.counter)
+
+        self.page_store.put(page_key, relative_link, extracted_page.main_title, page.text)
+
+        return page_key
 
-        return re.findall(link_pattern, page.text, flags= re.IGNORECASE | re.MULTILINE)
+    # Takes at most batch_size not yet visited links from the front of the frontier, keeping their BFS order
+    # @param batch_size <int>: maximal number of links in the batch
+    def next_batch(self, batch_size):
+        batch = []
+        while len(self.frontier) and len(batch) < batch_size:
+            relative_link = self.frontier.pop()
+            if not self.frontier.is_visited(relative_link):
+                batch.append(relative_link)
+
+        return batch
+
+    # Processes a downloaded page in BFS order: checks it for duplicates, saves it if it is new or changed and
+    # enqueues its links; pages answered with 304 or with an unchanged body are not saved again, their title and
+    # links are taken from the cache instead; near-duplicates of saved pages are neither saved nor counted
+    # Only 200 responses (and 304 for cached pages) are pages; error responses, including 5xx returned after the
+    # retries ran out, are skipped, and a cached page answered with 404 or 410 is removed as deleted
+    # @param relative_link <str>: url relative to root_url; e.g. "/wiki/Ysera"
+    # @param cached_page <dict>: cached information about the page or None
+    # @param response <Response>: response from server
+    # @param extracted_page <HtmlExtractor>: content extracted from the page by fetch, None unless the response is 200
+    # @param content_hash <str>: hash of the extracted content, None unless the response is 200
+    # @param fingerprint <int>: SimHash fingerprint of the page or None
+    def process_response(self, relative_link, cached_page, response, extracted_page, content_hash, fingerprint):
+        if response.status_code in (404, 410) and cached_page is not None:
+            self.delete_page(relative_link, cached_page)
+            return
+
+        if response.status_code != 200 and (response.status_code != 304 or cached_page is None):
+            print(f"Skipping {relative_link}: status {response.status_code}\n")
+            return
+
+        if response.status_code == 304:
+            content_hash, fingerprint = cached_page["content_hash"], cached_page["fingerprint"]
+
+        if cached_page is not None and content_hash == cached_page["content_hash"]:
+            main_title, links, status = cached_page["title"], cached_page["links"], None
+        else:
+            main_title, links = extracted_page.main_title, extracted_page.links
+            status = "changed" if cached_page is not None else "new"
+
+        if self.frontier.has_title(main_title):
+            return
+
+        # Pages answered with 304 have no body, their fingerprint is taken from the cache, so they are still indexed and
+        # later pages are checked against them
+        if self.duplicate_detector is not None:
+            duplicate_of = self.duplicate_detector.find_duplicate(fingerprint)
+            if duplicate_of is not None:
+                print(f"Skipping {main_title}: near-duplicate of {duplicate_of}\n")
+                if self.expand_near_duplicates:
+                    self.frontier.push_many(links)
+                return
+            self.duplicate_detector.add(fingerprint, relative_link)
+
+        print(f"[{self.counter}] {main_title}{'' if status else ' (unchanged)'}\n")
+        self.frontier.add_title(main_title)
+        self.frontier.mark_visited(relative_link)
+
+        page_key = cached_page["page_key"] if cached_page is not None else None
+        if status is not None:
+            page_key = self.save_html(response, relative_link, extracted_page, page_key)
+            self.change_log.add_change(relative_link, main_title, page_key, status)
+
+        if self.cache is not None:
+            self.cache.put(relative_link,
+                           response.headers.get("ETag", cached_page["etag"] if cached_page else None),
+                           response.headers.get("Last-Modified", cached_page["last_modified"] if cached_page else None),
+                           content_hash, main_title, page_key, links, fingerprint)
+
+        self.frontier.push_many(links)
+
+    # Removes a page deleted from the wiki from the page store and the cache and lists it in the manifest
+    # @param relative_link <str>: url relative to root_url; e.g. "/wiki/Ysera"
+    # @param cached_page <dict>: cached information about the page
+    def delete_page(self, relative_link, cached_page):
+        print(f"Deleted {cached_page['title']}\n")
+        self.page_store.delete(cached_page["page_key"])
+        self.cache.delete(relative_link)
+        self.change_log.add_change(relative_link, cached_page["title"], cached_page["page_key"], "deleted")
+
+    # Writes the manifest of new, changed and deleted pages, which later stages use to process only those pages;
+    # a crawl which checked no page and has no recorded changes keeps the manifest of the previous crawl
+    def write_manifest(self):
+        changes = self.change_log.get_changes()
+        if not self.checked_pages and not changes:
+            return
+
+        with open(self.manifest_path, "w", encoding="utf-8") as file:
+            file.write("Url\tTitle\tKey\tStatus\n")
+            for page in changes:
+                file.write("\t".join(page) + "\n")
 
     # Method, which initiates crawling on root url + starting (relative) url using BFS algorithm
     def crawl(self):
 
-        # For each link that is in unvisited_urls list, checks if the relative link is in the visited_urls list
-        # if so, removes that link from unvisited_urls and goes to another relative link; further, it is checked
-        # whether we already have downloaded a given number of pages - if so, crawling stops; further, it is checked
-        # through main title of the page for the duplicates - if the page is duplicate, we don't count nor save it
-        for relative_link in self.unvisited_urls:
-            if relative_link in self.visited_urls:
-                self.unvisited_urls.remove(relative_link)
-                continue
-
-            if len(self.visited_urls) < self.num_pages_to_download:
-                response = self.download_url(self.ROOT_URL + relative_link)
-                main_title = self.get_main_title(response.text)
-                if main_title in self.used_titles:
-                    continue
-                print(f"[{self.counter}] {main_title}\n")
-                self.used_titles.append(main_title)
-                self.visited_urls.append(relative_link)
-                self.unvisited_urls.remove(relative_link)
-
-                self.save_html(response)
-                self.unvisited_urls += self.find_links(response)
-            else:
-                break
+        # Links are taken from the front of the frontier in batches of at most num_workers links and downloaded
+        # concurrently; responses are then processed strictly in the order of the batch, so pages are counted, saved
+        # and their links appended exactly in the same BFS order as if they were downloaded one by one; the batch is
+        # never bigger than the number of pages still missing, so no more than num_pages_to_download pages are saved;
+        # through main title of the page it is checked for the duplicates - if the page is duplicate, we don't count
+        # nor save it; the frontier is checkpointed between batches, when all popped links were processed
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            while len(self.frontier) and self.frontier.visited_count() < self.num_pages_to_download:
+                batch = self.next_batch(min(self.num_workers,
+                                            self.num_pages_to_download - self.frontier.visited_count()))
+                cached_pages = [self.cache.get(link) if self.cache is not None else None for link in batch]
+
+                for relative_link, cached_page, fetched in zip(batch, cached_pages,
+                                                               executor.map(self.fetch, batch, cached_pages)):
+                    if fetched is not None:
+                        self.checked_pages += 1
+                        self.process_response(relative_link, cached_page, *fetched)
+
+                self.frontier.checkpoint()
+                if self.cache is not None:
+                    self.cache.commit()
+
+        self.frontier.set_meta("finished", 1)
+        if self.manifest_path is not None:
+            self.write_manifest()
+        self.frontier.close()
+        self.page_store.close()
+        if self.cache is not None:
+            self.cache.close()
+        self.session.close()
 
 
 if __name__ == "__main__":
-    crawler = Crawler(13000, "crawled_data","https://warcraft.wiki.gg","/wiki/World_of_Warcraft:_Dragonflight")
\ No newline at end of file
+    crawler = Crawler(13000, "crawled_data", "https://warcraft.wiki.gg", "/wiki/World_of_Warcraft:_Dragonflight",
+                      num_workers=8, requests_per_second=10, state_path="crawl_state.sqlite",
+                      cache_path="page_cache.sqlite", manifest_path="changed_pages.tsv", near_duplicate_threshold=0.95)
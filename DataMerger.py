@@ -1,32 +1,29 @@
+import time
 import pandas as pd
-import re
-import os
+from CorpusStore import CorpusReader, CorpusWriter
 
 # Merges the parsed data and wiki data
 if __name__ == "__main__":
     print("Merging...")
-    # Reads parsed data into pandas dataframe
-    parsed_data = pd.read_csv("parsed.tsv", sep="\t", encoding="utf-8")
+    start_time = time.perf_counter()
 
-    # Initiates new "Wiki" column where data from wiki will be saved
-    parsed_data["Wiki"] = ""
+    # Reads the entity texts extracted from wiki, one already cleaned row per entity, into a title -> wiki text
+    # hash map; it is the build side of the join, parsed data is only probed against it
+    wiki_data = pd.read_parquet("wiki_parsed", columns=["entity", "wiki"])
+    wiki_texts = dict(zip(wiki_data["entity"], wiki_data["wiki"]))
+    del wiki_data
 
-    # List of all files extracted from wiki
-    wiki_data_filenames = os.listdir("wiki_parsed")
+    # Streams parsed data one record batch at a time, so memory used by it is bounded by the batch size; every
+    # batch gets its new "Wiki" column by one lookup per row and is appended to the output right away
+    merged_rows = 0
+    with CorpusReader("parsed.arrow") as reader, \
+            CorpusWriter("merged.arrow", reader.columns + ["Wiki"]) as writer:
+        for batch in reader.iter_batches():
+            parsed_data = batch.to_pandas()
+            parsed_data["Wiki"] = parsed_data["Title"].map(wiki_texts).fillna("")
+            writer.write_data_frame(parsed_data)
 
-    for filename in wiki_data_filenames:
-        # Opens file regarding some entity
-        wiki_file = open(f"wiki_parsed/{filename}", encoding="utf-8")
-        wiki_file_data = wiki_file.read()
+            merged_rows += len(parsed_data)
+            print(f"{merged_rows} rows merged ({merged_rows / (time.perf_counter() - start_time):.0f} rows/s)")
 
-        # Looking for entity ID in the file and its cleaning from now useless characters and IDs
-        entity = re.search(r"\[\[([^\]]+?)\]\]", wiki_file_data, flags=re.I | re.M | re.DOTALL)
-        wiki_file_data = re.sub(r"\[\[[^\]]+?\]\]", "", wiki_file_data, flags=re.I | re.M | re.DOTALL)
-        wiki_file_data = re.sub(r"\n|\t|\r", "", wiki_file_data, flags=re.I | re.M | re.DOTALL)
-
-        # Appends new information to the dataframe
-        parsed_data.loc[parsed_data["Title"] == entity.groups()[0], "Wiki"] = wiki_file_data
-
-    # Export dataframe to file
-    parsed_data.to_csv("merged.tsv", sep='\t', encoding="utf-8", index=False)
-    print("Merging complete.")
\ No newline at end of file
+    print(f"Merging complete: {merged_rows} rows in {time.perf_counter() - start_time:.1f}s.")
@@ -0,0 +1,78 @@
+import hashlib
+import re
+import numpy as np
+
+
+# Near-duplicate detector class -> fingerprints pages with a 64-bit SimHash of their word shingles and keeps the
+# fingerprints in an LSH index; the fingerprint is split into max_distance + 1 bands, so by the pigeonhole principle
+# two fingerprints differing in at most max_distance bits agree on at least one band and meet in one of its buckets
+class NearDuplicateDetector:
+    FINGERPRINT_BITS = 64
+
+    # Constructor
+    # @param similarity_threshold <float>: share of equal fingerprint bits from which pages are near-duplicates; e.g. 0.95
+    # @param shingle_size <int>: number of consecutive words hashed together; e.g. 3
+    def __init__(self, similarity_threshold=0.95, shingle_size=3):
+        self.shingle_size = shingle_size
+        self.max_distance = int((1 - similarity_threshold) * self.FINGERPRINT_BITS)
+
+        num_bands = min(self.max_distance + 1, self.FINGERPRINT_BITS)
+        band_width = self.FINGERPRINT_BITS / num_bands
+        self.bands = []
+        for band in range(num_bands):
+            start, end = round(band * band_width), round((band + 1) * band_width)
+            self.bands.append((start, (1 << (end - start)) - 1))
+
+        self.buckets = [{} for _ in self.bands]
+        self.token_pattern = re.compile(r"\w+")
+        self.tag_pattern = re.compile(r"<[^>]*>")
+
+    # Given an HTML document, returns its visible text; only the <main> element is used when present, so navigation
+    # and other boilerplate shared by all pages doesn't make every page look similar
+    # @param document <str>: HTML document
+    def get_text(self, document):
+        start, end = document.find("<main"), document.rfind("</main>")
+        if start != -1 and end > start:
+            document = document[start:end]
+        return self.tag_pattern.sub(" ", document)
+
+    # Given an HTML document, returns its 64-bit SimHash fingerprint, or None if it has no text to compare
+    # Bits of all shingle hashes are counted at once in NumPy, which doesn't hold the GIL, so fetch workers can
+    # fingerprint pages in parallel
+    # @param document <str>: HTML document
+    def fingerprint(self, document):
+        tokens = self.token_pattern.findall(self.get_text(document).lower())
+        if not tokens:
+            return None
+
+        shingle_hashes = b"".join(
+            hashlib.blake2b(" ".join(tokens[i:i + self.shingle_size]).encode("utf-8"), digest_size=8).digest()
+            for i in range(max(1, len(tokens) - self.shingle_size + 1)))
+        bits = np.unpackbits(np.frombuffer(shingle_hashes, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+
+        # A bit of the fingerprint is set if it is set in more than a half of the shingle hashes
+        majority = np.packbits(2 * bits.sum(axis=0) > len(bits), bitorder="little")
+        return int.from_bytes(majority.tobytes(), "little")
+
+    # Returns key of an indexed page, which is a near-duplicate of the page with given fingerprint, or None
+    # @param fingerprint <int>: fingerprint of the page
+    def find_duplicate(self, fingerprint):
+        if fingerprint is None:
+            return None
+
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            for other_fingerprint, key in buckets.get(fingerprint >> shift & mask, ()):
+                if bin(fingerprint ^ other_fingerprint).count("1") <= self.max_distance:
+                    return key
+
+        return None
+
+    # Adds fingerprint of a page into the index
+    # @param fingerprint <int>: fingerprint of the page
+    # @param key <str>: identifier of the page returned by find_duplicate; e.g. "/wiki/Ysera"
+    def add(self, fingerprint, key):
+        if fingerprint is None:
+            return
+
+        for (shift, mask), buckets in zip(self.bands, self.buckets):
+            buckets.setdefault(fingerprint >> shift & mask, []).append((fingerprint, key))
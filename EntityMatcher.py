@@ -0,0 +1,92 @@
+from collections import deque
+
+
+# Entity matcher class -> Aho-Corasick automaton over lowercased entity names; finds every entity occurring in a text
+# in one pass over the text, regardless of the number of entities; a hit counts only if it starts and ends on word
+# boundaries with the same meaning as regex \b, so it matches like re.search(rf"\b{entity}\b") with the entity
+# taken literally
+class EntityMatcher:
+
+    # Constructor
+    # Builds the trie of all entities, its failure links and outputs; the matcher is meant to be built once on the
+    # driver and broadcast to executors
+    # @param entities <list>: entity names; e.g. ["Ysera", "Emerald Dream"]
+    def __init__(self, entities):
+        self.entities = list(dict.fromkeys(entity for entity in entities if entity))
+        self.lengths = []
+
+        # Node 0 is the root; transitions[node] maps a character to the next node and outputs[node] lists indices
+        # of entities ending in the node
+        self.transitions = [{}]
+        self.outputs = [[]]
+        for index, entity in enumerate(self.entities):
+            pattern = entity.lower()
+            self.lengths.append(len(pattern))
+
+            node = 0
+            for character in pattern:
+                next_node = self.transitions[node].get(character)
+                if next_node is None:
+                    next_node = len(self.transitions)
+                    self.transitions[node][character] = next_node
+                    self.transitions.append({})
+                    self.outputs.append([])
+                node = next_node
+            self.outputs[node].append(index)
+
+        # Failure link of a node points to the node of its longest proper suffix present in the trie
+        self.failures = [0] * len(self.transitions)
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for character, next_node in self.transitions[node].items():
+                failure = self.failures[node]
+                while failure and character not in self.transitions[failure]:
+                    failure = self.failures[failure]
+                self.failures[next_node] = self.transitions[failure].get(character, 0)
+                self.outputs[next_node] = self.outputs[next_node] + self.outputs[self.failures[next_node]]
+                queue.append(next_node)
+
+    # Returns True if given character is a regex word character (\w)
+    # @param character <str>: one character
+    def is_word_character(self, character):
+        return character.isalnum() or character == "_"
+
+    # Returns True if there is a word boundary (\b) in the text before given position
+    # @param text <str>: text
+    # @param position <int>: position in the text
+    def is_boundary(self, text, position):
+        before = position > 0 and self.is_word_character(text[position - 1])
+        after = position < len(text) and self.is_word_character(text[position])
+        return before != after
+
+    # Given a text, returns set of indices of entities occurring in it (case-insensitive, on word boundaries)
+    # @param text <str>: text to search; e.g. one sentence
+    def find_entities(self, text):
+        text = text.lower()
+        found = set()
+        node = 0
+        for position, character in enumerate(text):
+            while node and character not in self.transitions[node]:
+                node = self.failures[node]
+            node = self.transitions[node].get(character, 0)
+
+            for index in self.outputs[node]:
+                if index in found:
+                    continue
+                start = position + 1 - self.lengths[index]
+                if self.is_boundary(text, start) and self.is_boundary(text, position + 1):
+                    found.add(index)
+
+        return found
+
+    # Given sentences, returns dictionary of entity -> sentences containing it, in the order of the entities and
+    # the sentences; e.g. {"Illidan": ["Illidan is a demon hunter.", "Illidan uses fel energy."]}
+    # @param sentences <list>: sentences to search
+    def match_sentences(self, sentences):
+        entity_sentences = {}
+        for sentence in sentences:
+            for index in self.find_entities(sentence):
+                entity_sentences.setdefault(index, []).append(sentence)
+
+        return {self.entities[index]: entity_sentences[index] for index in sorted(entity_sentences)}
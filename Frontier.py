@@ -0,0 +1,130 @@
+import html
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit, quote, unquote
+from CrawlState import CrawlState
+
+
+# Normalizes a link, so different spellings of the same page are treated as one url; drops the fragment,
+# decodes HTML entities and unifies percent-encoding and spaces (MediaWiki treats "_" and " " the same)
+# @param url <str>: absolute or relative url; e.g. "/wiki/Ysera#Lore"
+def normalize_url(url):
+    scheme, netloc, path, query, _ = urlsplit(html.unescape(url.strip()))
+    path = quote(unquote(path).replace(" ", "_"), safe="/:@!$&'()*+,;=-._~")
+    return urlunsplit((scheme.lower(), netloc.lower(), path, query, ""))
+
+
+# Frontier class -> BFS queue of links to crawl together with the sets of seen links, visited links and used titles
+# The state is held in memory as a deque and hash sets, every change is also written to an SQLite database which is
+# committed on each checkpoint, so a killed crawl resumes from its last checkpoint; values stored by set_meta and
+# changes recorded by add_change are committed with it
+class Frontier(CrawlState):
+
+    # Constructor
+    # @param starting_url <str>: relative url the crawling starts with; e.g. "/wiki/World_of_Warcraft:_Dragonflight"
+    # @param state_path <str>: path to the SQLite file with crawl state; e.g. "crawl_state.sqlite"; None keeps the state in memory only
+    # @param checkpoint_interval <int>: number of newly visited pages after which the state is committed; e.g. 100
+    def __init__(self, starting_url, state_path=None, checkpoint_interval=100):
+        self.checkpoint_interval = checkpoint_interval
+        super().__init__(state_path if state_path is not None else ":memory:")
+        self.database.executescript("""
+            CREATE TABLE IF NOT EXISTS queue (position INTEGER PRIMARY KEY, url TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS titles (title TEXT PRIMARY KEY);
+        """)
+        self.load()
+        self.push_many([starting_url])
+        self.database.commit()
+
+    # Loads the committed state into memory
+    def load(self):
+
+        # Every url ever enqueued stays in the queue table, the head marks how many of them were already taken
+        self.head = int(self.get_meta("head", 0))
+        self.seen_urls = set()
+        self.queue = deque()
+        for position, url in self.database.execute("SELECT position, url FROM queue ORDER BY position"):
+            self.seen_urls.add(url)
+            if position > self.head:
+                self.queue.append(url)
+        self.next_position = self.head + len(self.queue) + 1
+
+        self.visited_urls = {url for url, in self.database.execute("SELECT url FROM visited")}
+        self.used_titles = {title for title, in self.database.execute("SELECT title FROM titles")}
+        self.visited_since_checkpoint = 0
+
+    # Starts a new crawl from the starting url; the queue, visited pages and used titles are dropped, values stored
+    # by set_meta (e.g. the page counter) are kept
+    # @param starting_url <str>: relative url the crawling starts with; e.g. "/wiki/World_of_Warcraft:_Dragonflight"
+    def reset(self, starting_url):
+        self.database.executescript("DELETE FROM queue; DELETE FROM visited; DELETE FROM titles;")
+        self.set_meta("head", 0)
+        self.load()
+        self.push_many([starting_url])
+        self.database.commit()
+
+    # Returns number of links waiting in the queue
+    def __len__(self):
+        return len(self.queue)
+
+    # Appends links, which were never seen before, to the end of the queue
+    # @param urls <list>: relative urls; e.g. ["/wiki/Ysera", "/wiki/Alexstrasza"]
+    def push_many(self, urls):
+        new_rows = []
+        for url in urls:
+            url = normalize_url(url)
+            if url in self.seen_urls:
+                continue
+            self.seen_urls.add(url)
+            self.queue.append(url)
+            new_rows.append((self.next_position, url))
+            self.next_position += 1
+
+        self.database.executemany("INSERT INTO queue (position, url) VALUES (?, ?)", new_rows)
+
+    # Removes and returns the first link of the queue
+    def pop(self):
+        self.head += 1
+        return self.queue.popleft()
+
+    # Returns True if the page on given url was already visited
+    # @param url <str>: normalized relative url
+    def is_visited(self, url):
+        return url in self.visited_urls
+
+    # Marks the page on given url as visited (downloaded and saved)
+    # @param url <str>: normalized relative url
+    def mark_visited(self, url):
+        self.visited_urls.add(url)
+        self.visited_since_checkpoint += 1
+        self.database.execute("INSERT OR IGNORE INTO visited (url) VALUES (?)", (url,))
+
+    # Returns number of visited pages
+    def visited_count(self):
+        return len(self.visited_urls)
+
+    # Returns True if a page with given main title was already saved
+    # @param title <str>: main title of the page
+    def has_title(self, title):
+        return title in self.used_titles
+
+    # Remembers main title of a saved page
+    # @param title <str>: main title of the page
+    def add_title(self, title):
+        self.used_titles.add(title)
+        self.database.execute("INSERT OR IGNORE INTO titles (title) VALUES (?)", (title,))
+
+    # Commits the state once at least checkpoint_interval pages were visited since the last checkpoint
+    # Must only be called when every popped link was fully processed, otherwise they would be lost on resume
+    # @param force <bool>: commit regardless of the number of visited pages
+    def checkpoint(self, force=False):
+        if not force and self.visited_since_checkpoint < self.checkpoint_interval:
+            return
+
+        self.set_meta("head", self.head)
+        self.database.commit()
+        self.visited_since_checkpoint = 0
+
+    # Commits the state and closes the database
+    def close(self):
+        self.checkpoint(force=True)
+        self.database.close()
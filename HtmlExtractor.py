@@ -0,0 +1,137 @@
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+
+# HTML extractor class -> event-driven extractor built on the standard library HTML tokenizer; it walks a document
+# once and collects the page title, main title, cleaned paragraphs, cleaned lists of the main content and wiki links
+# together, holding only the text of the element it is currently inside, so its runtime is linear in the document
+# The text is cleaned the same way as by Parser.clean_html_text: citations and special html characters are dropped,
+# leftover [n] citations, new lines, tabulators and escape return characters are removed
+class HtmlExtractor(HTMLParser):
+    CHUNK_SIZE = 64 * 1024
+    EXCLUDED_LINK_PREFIXES = ("/wiki/forum:", "/wiki/user:", "/wiki/file:", "/wiki/special:")
+
+    # Constructor
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.leftover_citation_regex = re.compile(r"\[[0-9]+\]")
+
+        self.title = ""
+        self.main_title = ""
+        self.paragraphs = []
+        self.lists = []
+        self.links = []
+
+        self.in_title = False
+        self.in_main_title_span = False
+        self.in_first_heading = False
+        self.first_heading = []
+        self.in_citation = False
+        self.in_script = False
+        self.main_depth = 0
+        self.list_depth = 0
+        self.paragraph = None
+        self.list_text = None
+        self.title_parts = []
+        self.main_title_parts = []
+
+    # Given an HTML document, feeds it to the tokenizer in chunks and returns the extractor holding the results
+    # @param document <str>: content of the HTML file
+    def extract(self, document):
+        for start in range(0, len(document), self.CHUNK_SIZE):
+            self.feed(document[start:start + self.CHUNK_SIZE])
+        self.close()
+
+        if not self.main_title:
+            self.main_title = "".join(self.first_heading)
+        return self
+
+    # Given a text fragment, returns it cleared of leftover citations and control characters
+    # @param text <str>: text to process
+    def clean_text(self, text):
+        if "[" in text:
+            text = self.leftover_citation_regex.sub("", text)
+        return text.replace("\n", "").replace("\t", "").replace("\r", "")
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+
+        if tag == "a":
+            href = attributes.get("href") or ""
+            if href.lower().startswith("#cite_note-"):
+                self.in_citation = True
+            elif href.startswith("/wiki/") and not href.lower().startswith(self.EXCLUDED_LINK_PREFIXES):
+                self.links.append(href)
+        elif tag == "p":
+            if self.paragraph is None:
+                self.paragraph = []
+        elif tag == "ul":
+            if self.main_depth:
+                if self.list_depth == 0:
+                    self.list_text = []
+                self.list_depth += 1
+        elif tag == "main":
+            self.main_depth += 1
+        elif tag == "title":
+            self.in_title = True
+        elif tag == "span" and "mw-page-title-main" in (attributes.get("class") or "").split():
+            self.in_main_title_span = True
+        elif tag == "h1" and attributes.get("id") == "firstHeading":
+            self.in_first_heading = True
+        elif tag in ("script", "style"):
+            self.in_script = True
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            self.in_citation = False
+        elif tag == "p":
+            if self.paragraph is not None:
+                self.paragraphs.append(self.clean_text("".join(self.paragraph)))
+                self.paragraph = None
+        elif tag == "ul":
+            if self.list_depth:
+                self.list_depth -= 1
+                if self.list_depth == 0:
+                    self.lists.append(self.clean_text("".join(self.list_text)))
+                    self.list_text = None
+        elif tag == "main":
+            self.main_depth = max(0, self.main_depth - 1)
+        elif tag == "title":
+            self.in_title = False
+            self.title = "".join(self.title_parts)
+        elif tag == "span" and self.in_main_title_span:
+            self.in_main_title_span = False
+            if not self.main_title:
+                self.main_title = "".join(self.main_title_parts)
+        elif tag == "h1":
+            self.in_first_heading = False
+        elif tag in ("script", "style"):
+            self.in_script = False
+
+    def handle_data(self, data):
+        self.add_title_text(data)
+        if self.in_citation or self.in_script:
+            return
+
+        if self.paragraph is not None:
+            self.paragraph.append(data)
+        if self.list_text is not None:
+            self.list_text.append(data)
+
+    # Titles keep special html characters, decoded; paragraphs and lists drop them like the regex cleaning does
+    def handle_entityref(self, name):
+        self.add_title_text(unescape(f"&{name};"))
+
+    def handle_charref(self, name):
+        self.add_title_text(unescape(f"&#{name};"))
+
+    # Appends text to the titles whose element is currently open
+    # @param text <str>: decoded text
+    def add_title_text(self, text):
+        if self.in_title:
+            self.title_parts.append(text)
+        if self.in_main_title_span and not self.main_title:
+            self.main_title_parts.append(text)
+        if self.in_first_heading:
+            self.first_heading.append(text)
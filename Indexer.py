@@ -1,15 +1,67 @@
 import lucene
 import os
-import csv
-import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from java.nio.file import Paths
 from java.lang import Integer
 from org.apache.lucene.analysis.standard import StandardAnalyzer
-from org.apache.lucene.document import Document, Field, StringField, TextField, FieldType
-from org.apache.lucene.index import IndexWriter, IndexWriterConfig, DirectoryReader, IndexOptions
+from org.apache.lucene.document import Document, Field, StringField, TextField, FieldType, SortedDocValuesField
+from org.apache.lucene.index import IndexWriter, IndexWriterConfig, DirectoryReader, IndexOptions, TieredMergePolicy, Term
+from org.apache.lucene.index import DocValues, DocValuesType, ReaderUtil, QueryTimeoutImpl
 from org.apache.lucene.store import FSDirectory
-from org.apache.lucene.search import IndexSearcher, BooleanQuery, BooleanClause
+from org.apache.lucene.search import BooleanQuery, BooleanClause, SearcherManager, SearcherFactory, ScoreDoc, IndexSearcher
 from org.apache.lucene.queryparser.classic import QueryParser
+from org.apache.lucene.util import BytesRef
+from CorpusStore import CorpusReader
+from QueryCache import QueryCache
+from SearchCursor import encode_cursor, decode_cursor
+
+# Index schemas -> options of every field, the "*" entry applies to fields not listed by name
+#   stored <bool>: value is stored and can be returned with the results
+#   index_options <str>: name of IndexOptions; "NONE", "DOCS", "DOCS_AND_FREQS" or "DOCS_AND_FREQS_AND_POSITIONS"
+#   norms <bool>: field length is kept for scoring
+#   doc_values <bool>: value is also kept as SortedDocValues, for sorting and fast retrieval
+# Only the title is stored by default; the large content fields are searchable but not stored, and term frequencies
+# and positions enable real BM25 scoring and phrase queries
+DEFAULT_SCHEMA = {
+    "Title": {"stored": True, "index_options": "DOCS_AND_FREQS_AND_POSITIONS", "norms": True, "doc_values": True},
+    "*": {"stored": False, "index_options": "DOCS_AND_FREQS_AND_POSITIONS", "norms": True, "doc_values": False},
+}
+
+# Schema of the original index, every field stored and indexed without term frequencies
+LEGACY_SCHEMA = {
+    "*": {"stored": True, "index_options": "DOCS", "norms": True, "doc_values": False},
+}
+
+# Untokenized copy of the title, documents are updated and deleted by this key
+TITLE_KEY_FIELD = "Title_id"
+
+# Returns options of the field in the schema
+# @param schema <dict>: index schema; e.g. DEFAULT_SCHEMA
+# @param field_name <str>: name of the field; e.g. "Title"
+def get_field_options(schema, field_name):
+    return schema.get(field_name, schema["*"])
+
+# Returns frozen FieldType built from the options of a field
+# @param options <dict>: options of the field; e.g. DEFAULT_SCHEMA["Title"]
+def create_field_type(options):
+    if options["index_options"] == "NONE" and not options["stored"]:
+        raise ValueError("Field has to be stored or indexed")
+
+    field_type = FieldType()
+    field_type.setStored(options["stored"])
+    field_type.setIndexOptions(getattr(IndexOptions, options["index_options"]))
+    field_type.setOmitNorms(not options["norms"])
+    field_type.freeze()
+
+    return field_type
+
+# Returns size of the index on disk in bytes
+# @param index_directory <str>: directory with the index; e.g. "index"
+def get_index_size(index_directory):
+    return sum(entry.stat().st_size for entry in os.scandir(index_directory) if entry.is_file())
 
 # Indexer class
 class Indexer:
@@ -21,10 +73,24 @@ class Indexer:
             lucene.initVM()
             cls.JVM_INITIALIZED = True
 
+    # Attaches the calling thread to the JVM, every thread calling into Lucene must be attached
+    @classmethod
+    def attach_current_thread(cls):
+        lucene.getVMEnv().attachCurrentThread()
+
     ## Initiates pylucene, index directory, standard analyzer, index config and index writer
-    def __init__(self):
+    # @param ram_buffer_mb <float>: RAM used for buffering documents before they are flushed as a segment; e.g. 256;
+    #                               None keeps Lucene's default (16 MB)
+    # @param segments_per_tier <float>: number of segments allowed per tier by the merge policy; None keeps the default
+    # @param max_merged_segment_mb <float>: maximal size of a segment produced by a merge; None keeps the default
+    # @param schema <dict>: options of the indexed fields; None uses DEFAULT_SCHEMA
+    # @param index_directory <str>: directory with the index; e.g. "index"
+    # @param open_mode <str>: name of IndexWriterConfig.OpenMode; "CREATE" replaces the index, "CREATE_OR_APPEND"
+    #                         keeps it for update_data
+    def __init__(self, ram_buffer_mb=None, segments_per_tier=None, max_merged_segment_mb=None, schema=None,
+                 index_directory="index", open_mode="CREATE"):
         self.init_jvm()
-        self.index_directory = "index"
+        self.index_directory = index_directory
         if not os.path.exists(self.index_directory):
             os.mkdir(self.index_directory)
 
@@ -32,125 +98,510 @@ class Indexer:
 
         self.analyzer = StandardAnalyzer()
         self.config = IndexWriterConfig(self.analyzer)
-        self.config.setOpenMode(IndexWriterConfig.OpenMode.CREATE)
+        self.config.setOpenMode(getattr(IndexWriterConfig.OpenMode, open_mode))
+        if ram_buffer_mb is not None:
+            self.config.setRAMBufferSizeMB(float(ram_buffer_mb))
+        if segments_per_tier is not None or max_merged_segment_mb is not None:
+            merge_policy = TieredMergePolicy()
+            if segments_per_tier is not None:
+                merge_policy.setSegmentsPerTier(float(segments_per_tier))
+            if max_merged_segment_mb is not None:
+                merge_policy.setMaxMergedSegmentMB(float(max_merged_segment_mb))
+            self.config.setMergePolicy(merge_policy)
         self.writer = IndexWriter(FSDirectory.open(self.index_path), self.config)
         self.dir = FSDirectory.open(self.index_path)
 
-    # Create a new index from the input file
-    def index_data(self, path_to_parsed_data):
-        with open(path_to_parsed_data, "r", encoding='utf-8') as parsed_data:
-            reader = csv.reader(parsed_data, delimiter="\t")
-            # Reads header, that will be used as document fields
-            header = next(reader)
-            for i, line in enumerate(reader):
-                doc = Document()
+        self.schema = schema if schema is not None else DEFAULT_SCHEMA
+        self.field_types = {}
+
+        self.thread_documents = threading.local()
+
+    # Returns document and its fields owned by the calling thread; they are created once per thread and reused
+    # for every row, only the values of the fields change
+    # @param header <list>: names of the fields
+    def get_thread_document(self, header):
+        if getattr(self.thread_documents, "header", None) != header:
+            doc = Document()
+            fields = [Field(field_name, "", self.get_field_type(field_name)) for field_name in header]
+            doc_values_fields = [SortedDocValuesField(field_name, BytesRef(""))
+                                 if get_field_options(self.schema, field_name)["doc_values"] else None
+                                 for field_name in header]
+            key_field = StringField(TITLE_KEY_FIELD, "", Field.Store.NO) if "Title" in header else None
+            for field in fields + doc_values_fields + [key_field]:
+                if field is not None:
+                    doc.add(field)
+            self.thread_documents.header = header
+            self.thread_documents.document = (doc, fields, doc_values_fields, key_field)
+
+        return self.thread_documents.document
+
+    # Returns field type of the field, field types are shared by all documents
+    # @param field_name <str>: name of the field; e.g. "Title"
+    def get_field_type(self, field_name):
+        if field_name not in self.field_types:
+            self.field_types[field_name] = create_field_type(get_field_options(self.schema, field_name))
+
+        return self.field_types[field_name]
+
+    # Adds rows as documents to the index, called by the indexing threads
+    # @param rows <list>: rows with values in the order of the header
+    # @param header <list>: names of the fields
+    # @param upsert <bool>: documents replace indexed documents with the same title instead of being added
+    def add_documents(self, rows, header, upsert=False):
+        doc, fields, doc_values_fields, key_field = self.get_thread_document(header)
+        title_index = header.index("Title") if key_field is not None else None
+        for row in rows:
+            for field, doc_values_field, value in zip(fields, doc_values_fields, row):
+                field.setStringValue(value or "")
+                if doc_values_field is not None:
+                    doc_values_field.setBytesValue(BytesRef(value or ""))
+            if key_field is not None:
+                key_field.setStringValue(row[title_index] or "")
+
+            if upsert:
+                self.writer.updateDocument(Term(TITLE_KEY_FIELD, row[title_index] or ""), doc)
+            else:
+                self.writer.addDocument(doc)
 
-                field_type = FieldType()
-                field_type.setStored(True)
-                field_type.setIndexOptions(IndexOptions.DOCS)
+        return len(rows)
 
-                for j, field_name in enumerate(header):
-                    doc.add(Field(field_name, line[j], field_type))
+    # Create a new index from the input file
+    # Rows are read in chunks by the calling thread and indexed by num_threads threads attached to the JVM, which all
+    # feed the shared IndexWriter; with more than one thread the order of documents in the index is not fixed
+    # @param path_to_parsed_data <str>: corpus file written by DataMerger; e.g. "merged.arrow"
+    # @param columns <list>: columns to index; None indexes all of them
+    # @param num_threads <int>: number of indexing threads; e.g. os.cpu_count()
+    # @param chunk_size <int>: number of rows handed to a thread at once
+    # @param force_merge_segments <int>: if given, the index is merged down to this number of segments at the end
+    # @param progress_every <int>: number of indexed documents between two progress reports
+    def index_data(self, path_to_parsed_data, columns=None, num_threads=1, chunk_size=500, force_merge_segments=None,
+                   progress_every=10000):
+        start_time = time.perf_counter()
+        indexed_documents = 0
+        next_report = progress_every
+
+        with CorpusReader(path_to_parsed_data) as reader, \
+                ThreadPoolExecutor(num_threads, initializer=self.attach_current_thread) as executor:
+            # Names of the read columns will be used as document fields
+            header = columns if columns is not None else reader.columns
+
+            pending = set()
+            rows = reader.iter_rows(header)
+            while True:
+                chunk = [row for _, row in zip(range(chunk_size), rows)]
+                if chunk:
+                    pending.add(executor.submit(self.add_documents, chunk, header))
+
+                # Keeps at most two chunks per thread in flight, so memory stays bounded
+                if len(pending) >= 2 * num_threads or (not chunk and pending):
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    indexed_documents += sum(future.result() for future in done)
+                    if indexed_documents >= next_report:
+                        print(f"{indexed_documents} documents indexed "
+                              f"({indexed_documents / (time.perf_counter() - start_time):.0f} docs/s)")
+                        next_report += progress_every
+
+                if not chunk and not pending:
+                    break
+
+        if force_merge_segments is not None:
+            self.writer.forceMerge(force_merge_segments)
 
-                self.writer.addDocument(doc)
+        self.writer.commit()
+        self.writer.close()
 
+        elapsed = time.perf_counter() - start_time
+        print(f"Indexed {indexed_documents} documents in {elapsed:.1f}s ({indexed_documents / elapsed:.0f} docs/s), "
+              f"index size {get_index_size(self.index_directory) / 2 ** 20:.1f} MB")
+
+        return elapsed
+
+    # Updates existing index with changed rows, each row replaces the document with the same title or is added if
+    # there is none; the writer has to be opened with open_mode="CREATE_OR_APPEND" and stays open until close
+    # @param changed_rows_path <str>: corpus file with the changed rows, in the format of DataMerger; e.g. "changed.arrow"
+    # @param deleted_titles <list>: titles of documents removed from the index
+    # @param commit_every <int>: number of changes between two commits, so searchers see the update progressively
+    # @return <int>: number of updated and deleted documents
+    def update_data(self, changed_rows_path, deleted_titles=None, commit_every=1000):
+        start_time = time.perf_counter()
+        changes = 0
+
+        with CorpusReader(changed_rows_path) as reader:
+            header = reader.columns
+            if "Title" not in header:
+                raise ValueError(f"{changed_rows_path} has no Title column")
+
+            rows = reader.iter_rows(header)
+            while True:
+                chunk = [row for _, row in zip(range(commit_every), rows)]
+                if not chunk:
+                    break
+                changes += self.add_documents(chunk, header, upsert=True)
+                self.writer.commit()
+
+        deleted_titles = list(deleted_titles or [])
+        for start in range(0, len(deleted_titles), commit_every):
+            for title in deleted_titles[start:start + commit_every]:
+                self.writer.deleteDocuments(Term(TITLE_KEY_FIELD, title))
+                changes += 1
+            self.writer.commit()
+
+        print(f"Applied {changes} changes in {time.perf_counter() - start_time:.1f}s")
+        return changes
+
+    # Commits pending changes and closes the writer
+    def close(self):
         self.writer.commit()
         self.writer.close()
 
+    # Returns searcher over the index of this indexer, opened on first use
+    def get_searcher(self):
+        if getattr(self, "searcher", None) is None:
+            self.searcher = Searcher(self.index_directory, self.analyzer)
+
+        return self.searcher
+
     # Search index
     # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
     def search_documents_and(self, query, number_of_results):
-        if number_of_results < 0:
-            return None
-
-        if query == "":
-            return None
-
-        counter = 0
-
-        multi_queries = query.split(" AND ")
-        searcher = IndexSearcher(DirectoryReader.open(self.dir))
+        return self.get_searcher().search_documents_and(query, number_of_results)
 
-        # Boolean query builder helps with boolean queries
-        bool_query = BooleanQuery.Builder()
-
-        for multi_query in multi_queries:
-            column_to_search, keyword = multi_query.split(":")
-            parsed_query = QueryParser(column_to_search, self.analyzer).parse(f"{keyword}")
-            bool_query.add(parsed_query, BooleanClause.Occur.MUST)
-
-        results = searcher.search(bool_query.build(), number_of_results)
-
-        return_results = []
-
-        for result in results.scoreDocs:
-            counter += 1
-            return_results.append((counter, searcher.doc(result.doc).get("Title"), result.score))
+    # Search index
+    # @param query <str>: Query for index; e.g. "Title:Illidan OR Wiki:fel"
+    def search_documents_or(self, query, number_of_results):
+        return self.get_searcher().search_documents_or(query, number_of_results)
 
-            if counter >= number_of_results:
-                break
+    # Prints results to stdout
+    # @param results <list>: results to be printed; contains tuples (int, str, float)
+    @staticmethod
+    def print_results(results):
+        if len(results) == 0:
+            print("No results found =(")
+            return
 
-        return return_results
+        for counter, doc_name, doc_score in results:
+            print(f"  {counter}\n======")
+            print("=  Title: ", doc_name, "\n=\tScore: %.5f" % doc_score)
+            print("======\n")
 
-# Search index
-    # @param query <str>: Query for index; e.g. "Title:Illidan OR Wiki:fel"
-    def search_documents_or(self, query, number_of_results):
+# Builds an index of the input file with every schema in a temporary directory and prints indexing time and index size
+# @param path_to_parsed_data <str>: corpus file written by DataMerger; e.g. "merged.arrow"
+# @param schemas <dict>: compared schemas by their names; None compares DEFAULT_SCHEMA with LEGACY_SCHEMA
+# @param indexing_options <dict>: keyword arguments of index_data; e.g. {"num_threads": 4}
+# @return <dict>: (indexing time in seconds, index size in bytes) by names of the schemas
+def compare_schemas(path_to_parsed_data, schemas=None, **indexing_options):
+    if schemas is None:
+        schemas = {"default": DEFAULT_SCHEMA, "legacy": LEGACY_SCHEMA}
+
+    comparison = {}
+    for name, schema in schemas.items():
+        with tempfile.TemporaryDirectory() as index_directory:
+            indexer = Indexer(schema=schema, index_directory=index_directory)
+            elapsed = indexer.index_data(path_to_parsed_data, **indexing_options)
+            comparison[name] = (elapsed, get_index_size(index_directory))
+
+    print(f"{'Schema':<16}{'Time [s]':>12}{'Size [MB]':>12}")
+    for name, (elapsed, size) in comparison.items():
+        print(f"{name:<16}{elapsed:>12.2f}{size / 2 ** 20:>12.1f}")
+
+    return comparison
+
+# Splits query into its (column, keywords) clauses, whitespace inside the keywords is collapsed, so queries differing
+# only in spacing share one cache entry
+# @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+# @param operator <str>: separator of the clauses; " AND " or " OR "
+def normalize_query(query, operator):
+    clauses = []
+    for multi_query in query.split(operator):
+        column_to_search, keyword = multi_query.split(":")
+        clauses.append((column_to_search, " ".join(keyword.split())))
+
+    return tuple(clauses)
+
+# Builds boolean query from clauses "Column:keywords" joined by the operator
+# @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+# @param operator <str>: separator of the clauses; " AND " or " OR "
+# @param occur <BooleanClause.Occur>: occurrence of every clause in the boolean query
+# @param analyzer <Analyzer>: analyzer used to parse the keywords
+def build_boolean_query(query, operator, occur, analyzer):
+    # Boolean query builder helps with boolean queries
+    bool_query = BooleanQuery.Builder()
+
+    for multi_query in query.split(operator):
+        column_to_search, keyword = multi_query.split(":")
+        parsed_query = QueryParser(column_to_search, analyzer).parse(f"{keyword}")
+        bool_query.add(parsed_query, occur)
+
+    return bool_query.build()
+
+# Returns titles of the documents in the order of the documents
+# Titles are read in document order from the SortedDocValues of the segments, segments without doc values of Title
+# (e.g. built with LEGACY_SCHEMA) fall back to the stored field
+# @param searcher <IndexSearcher>: searcher the documents come from
+# @param docs <list>: document numbers
+def get_titles(searcher, docs):
+    leaves = searcher.getIndexReader().leaves()
+    leaf_doc_values = {}
+    titles = {}
+
+    for doc in sorted(set(docs)):
+        leaf = leaves.get(ReaderUtil.subIndex(doc, leaves))
+        if leaf.ord not in leaf_doc_values:
+            field_info = leaf.reader().getFieldInfos().fieldInfo("Title")
+            has_doc_values = field_info is not None and field_info.getDocValuesType() == DocValuesType.SORTED
+            leaf_doc_values[leaf.ord] = DocValues.getSorted(leaf.reader(), "Title") if has_doc_values else None
+
+        doc_values = leaf_doc_values[leaf.ord]
+        if doc_values is not None and doc_values.advanceExact(doc - leaf.docBase):
+            titles[doc] = doc_values.lookupOrd(doc_values.ordValue()).utf8ToString()
+        else:
+            titles[doc] = searcher.doc(doc).get("Title")
+
+    return [titles[doc] for doc in docs]
+
+# Read-only searcher over an existing index
+# The index is opened once and the IndexSearcher is shared by all threads through a SearcherManager, which reopens
+# the reader only when the index has changed since the last refresh
+class Searcher:
+    # Separator of the clauses of every search mode and whether every clause is required; BooleanClause.Occur is
+    # resolved by get_mode, static fields of Java classes exist only once the JVM is started
+    MODES = {"AND": (" AND ", True), "OR": (" OR ", False)}
+
+    ## Opens the index for searching, the index is never modified
+    # @param index_directory <str>: directory with the index; e.g. "index"
+    # @param analyzer <Analyzer>: analyzer used to parse the queries; None uses StandardAnalyzer
+    # @param refresh_interval <float>: minimal number of seconds between two checks for index changes;
+    #                                  0 checks before every query
+    # @param cache_size <int>: maximal number of cached parsed queries and of cached results; 0 disables caching
+    # @param cache_ttl <float>: number of seconds a cached result stays valid; None keeps it until the index changes
+    def __init__(self, index_directory="index", analyzer=None, refresh_interval=1.0, cache_size=1024, cache_ttl=300.0):
+        Indexer.init_jvm()
+        self.index_directory = index_directory
+        self.analyzer = analyzer if analyzer is not None else StandardAnalyzer()
+        self.dir = FSDirectory.open(Paths.get(index_directory))
+        self.manager = SearcherManager(self.dir, SearcherFactory())
+        self.refresh_interval = refresh_interval
+        self.last_refresh = time.monotonic()
+
+        # Parsed queries don't depend on the index, results are dropped whenever a new commit becomes visible
+        self.query_cache = QueryCache(cache_size, ttl=None)
+        self.result_cache = QueryCache(cache_size, cache_ttl)
+
+    # Returns separator and occurrence of the clauses of given search mode
+    # @param mode <str>: "AND" or "OR"
+    def get_mode(self, mode):
+        operator, required = self.MODES[mode]
+        return operator, BooleanClause.Occur.MUST if required else BooleanClause.Occur.SHOULD
+
+    # Reopens the reader if the index has changed, readers of in-flight queries stay open until released
+    # @return <bool>: True if the searcher is up to date with the index
+    def refresh(self):
+        self.last_refresh = time.monotonic()
+        return self.manager.maybeRefresh()
+
+    # Refreshes the searcher if refresh_interval has elapsed since the last refresh
+    def maybe_refresh(self):
+        if time.monotonic() - self.last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    # Returns searcher over the reader of an acquired searcher, which stops the query once the timeout elapses; the
+    # acquired searcher is shared by all threads, so it can't carry a timeout of one query
+    # Raises TimeoutError if no time is left
+    # @param searcher <IndexSearcher>: searcher acquired from the manager
+    # @param timeout <float>: seconds the query may run; None returns the acquired searcher
+    def get_timed_searcher(self, searcher, timeout):
+        if timeout is None:
+            return searcher
+        if timeout <= 0:
+            raise TimeoutError("Query timed out before it was executed")
+
+        timed_searcher = IndexSearcher(searcher.getIndexReader())
+        timed_searcher.setSimilarity(searcher.getSimilarity())
+        timed_searcher.setTimeout(QueryTimeoutImpl(max(1, int(timeout * 1000))))
+        return timed_searcher
+
+    # Executes boolean query built from the clauses of the query
+    # Raises TimeoutError if the query doesn't finish within the timeout, its partial results are neither returned
+    # nor cached
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param number_of_results <int>: maximal number of returned results
+    # @param operator <str>: separator of the clauses; " AND " or " OR "
+    # @param occur <BooleanClause.Occur>: occurrence of every clause in the boolean query
+    # @param timeout <float>: seconds the query may run inside Lucene; None doesn't limit it
+    def search(self, query, number_of_results, operator, occur, timeout=None):
         if number_of_results < 0:
             return None
 
         if query == "":
             return None
 
-        counter = 0
-
-        multi_queries = query.split(" OR ")
-        searcher = IndexSearcher(DirectoryReader.open(self.dir))
-
-        # Boolean query builder helps with boolean queries
-        bool_query = BooleanQuery.Builder()
-
-        for multi_query in multi_queries:
-            column_to_search, keyword = multi_query.split(":")
-            parsed_query = QueryParser(column_to_search, self.analyzer).parse(f"{keyword}")
-            bool_query.add(parsed_query, BooleanClause.Occur.SHOULD)
+        self.maybe_refresh()
+        clauses, bool_query = self.get_query(query, operator, occur)
+
+        searcher = self.manager.acquire()
+        try:
+            version = DirectoryReader.cast_(searcher.getIndexReader()).getVersion()
+            self.result_cache.set_generation(version)
+            result_key = (operator, clauses, number_of_results)
+            cached_results = self.result_cache.get(result_key, version)
+            if cached_results is not None:
+                return list(cached_results)
+
+            timed_searcher = self.get_timed_searcher(searcher, timeout)
+            score_docs = list(timed_searcher.search(bool_query, number_of_results).scoreDocs)[:number_of_results]
+            if timeout is not None and timed_searcher.timedOut():
+                raise TimeoutError(f"Query timed out after {timeout:.3f}s")
+            titles = get_titles(searcher, [result.doc for result in score_docs])
+            return_results = [(counter, title, result.score)
+                              for counter, (result, title) in enumerate(zip(score_docs, titles), start=1)]
+            # Another query may have moved the cache to a newer generation while this one was executed
+            self.result_cache.put(result_key, tuple(return_results), version)
+        finally:
+            self.manager.release(searcher)
 
-        results = searcher.search(bool_query.build(), number_of_results)
+        return return_results
 
-        return_results = []
+    # Returns normalized clauses of the query and the parsed boolean query, parsed queries are cached
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param operator <str>: separator of the clauses; " AND " or " OR "
+    # @param occur <BooleanClause.Occur>: occurrence of every clause in the boolean query
+    def get_query(self, query, operator, occur):
+        clauses = normalize_query(query, operator)
+        bool_query = self.query_cache.get((operator, clauses))
+        if bool_query is None:
+            bool_query = build_boolean_query(query, operator, occur, self.analyzer)
+            self.query_cache.put((operator, clauses), bool_query)
+
+        return clauses, bool_query
+
+    # Returns one page of results and the cursor of the next page; every page costs the same as the first one, as the
+    # search continues after the last hit of the previous page instead of collecting all preceding hits
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param number_of_results <int>: number of results on the page
+    # @param mode <str>: "AND" or "OR"
+    # @param cursor <str>: token returned with the previous page; None for the first page
+    # @param timeout <float>: seconds the query may run inside Lucene; None doesn't limit it; raises TimeoutError
+    # @return <tuple>: (results, cursor of the next page or None after the last page); (None, None) for invalid input
+    def search_page(self, query, number_of_results, mode="AND", cursor=None, timeout=None):
+        if number_of_results < 0:
+            return None, None
 
-        for result in results.scoreDocs:
-            counter += 1
-            return_results.append((counter, searcher.doc(result.doc).get("Title"), result.score))
+        if query == "":
+            return None, None
+
+        operator, occur = self.get_mode(mode)
+        self.maybe_refresh()
+        clauses, bool_query = self.get_query(query, operator, occur)
+
+        searcher = self.manager.acquire()
+        try:
+            version = DirectoryReader.cast_(searcher.getIndexReader()).getVersion()
+            timed_searcher = self.get_timed_searcher(searcher, timeout)
+            if cursor is None:
+                rank = 0
+                results = timed_searcher.search(bool_query, max(number_of_results, 1))
+            else:
+                score, doc, rank = decode_cursor(cursor, version, (mode, clauses))
+                results = timed_searcher.searchAfter(ScoreDoc(doc, score), bool_query, max(number_of_results, 1))
+            if timeout is not None and timed_searcher.timedOut():
+                raise TimeoutError(f"Query timed out after {timeout:.3f}s")
+
+            score_docs = list(results.scoreDocs)[:number_of_results]
+            titles = get_titles(searcher, [result.doc for result in score_docs])
+        finally:
+            self.manager.release(searcher)
+
+        return_results = [(counter, title, result.score)
+                          for counter, (result, title) in enumerate(zip(score_docs, titles), start=rank + 1)]
+        next_cursor = None
+        if return_results and len(return_results) == number_of_results:
+            last = score_docs[-1]
+            next_cursor = encode_cursor(version, (mode, clauses), last.score, last.doc, rank + len(return_results))
+
+        return return_results, next_cursor
+
+    # Yields all results of the query lazily, (rank, title, score) one by one; hits are fetched page by page from one
+    # point-in-time view of the index, which stays open until the generator is exhausted or closed
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param mode <str>: "AND" or "OR"
+    # @param page_size <int>: number of hits fetched at once
+    def iter_hits(self, query, mode="AND", page_size=100):
+        if query == "":
+            return
 
-            if counter >= number_of_results:
-                break
+        operator, occur = self.get_mode(mode)
+        self.maybe_refresh()
+        _, bool_query = self.get_query(query, operator, occur)
+
+        searcher = self.manager.acquire()
+        try:
+            rank, after = 0, None
+            while True:
+                if after is None:
+                    score_docs = searcher.search(bool_query, page_size).scoreDocs
+                else:
+                    score_docs = searcher.searchAfter(after, bool_query, page_size).scoreDocs
+
+                for result, title in zip(score_docs, get_titles(searcher, [result.doc for result in score_docs])):
+                    rank += 1
+                    yield rank, title, result.score
+
+                if len(score_docs) < page_size:
+                    return
+                after = score_docs[-1]
+        finally:
+            self.manager.release(searcher)
+
+    # Returns hit and miss counters of the parsed query and result caches
+    def cache_stats(self):
+        return {"queries": self.query_cache.stats(), "results": self.result_cache.stats()}
 
-        return return_results
+    # Search index
+    # @param query <str>: Query for index; e.g. "Title:Illidan AND Wiki:fel"
+    # @param timeout <float>: seconds the query may run inside Lucene; None doesn't limit it; raises TimeoutError
+    def search_documents_and(self, query, number_of_results, timeout=None):
+        return self.search(query, number_of_results, " AND ", BooleanClause.Occur.MUST, timeout)
 
-    # Prints results to stdout
-    # @param results <list>: results to be printed; contains tuples (int, str, float)
-    def print_results(self, results):
-        if len(results) == 0:
-            print("No results found =(")
-            return
+    # Search index
+    # @param query <str>: Query for index; e.g. "Title:Illidan OR Wiki:fel"
+    # @param timeout <float>: seconds the query may run inside Lucene; None doesn't limit it; raises TimeoutError
+    def search_documents_or(self, query, number_of_results, timeout=None):
+        return self.search(query, number_of_results, " OR ", BooleanClause.Occur.SHOULD, timeout)
 
-        for counter, doc_name, doc_score in results:
-            print(f"  {counter}\n======")
-            print("=  Title: ", doc_name, "\n=\tScore: %.5f" % doc_score)
-            print("======\n")
+    # Closes the searcher, the index directory stays untouched
+    def close(self):
+        self.manager.close()
+        self.dir.close()
 
 if __name__ == "__main__":
-    csv.field_size_limit(sys.maxsize)
-    indexer = Indexer()
-    print("Please select one of the options:\n\t[1]: Create new index\n\t[2]: Query\n\t[3]: Exit")
+    print("Please select one of the options:\n\t[1]: Create new index\n\t[2]: Query\n\t[3]: Compare index schemas"
+          "\n\t[4]: Update index\n\t[5]: Exit")
     start_choice = input("Choice: ")
 
-    if start_choice not in ["1", "2"]:
+    if start_choice not in ["1", "2", "3", "4"]:
+        quit()
+
+    if start_choice == "4":
+        indexer = Indexer(open_mode="CREATE_OR_APPEND")
+        changed_rows_path = input("Path to the file with changed rows: ")
+        deleted_titles_path = input("Path to the file with deleted titles, one per line (empty for none): ")
+        deleted_titles = []
+        if deleted_titles_path:
+            with open(deleted_titles_path, encoding="utf-8") as deleted_titles_file:
+                deleted_titles = [line.rstrip("\n") for line in deleted_titles_file if line.strip()]
+        indexer.update_data(changed_rows_path, deleted_titles)
+        indexer.close()
+        start_choice = "2"
+
+    if start_choice == "3":
+        compare_schemas(input("Path to the file to be indexed: "), num_threads=os.cpu_count())
         quit()
 
     if start_choice == "1":
+        # Only building a new index opens a writer, querying leaves the existing index untouched
+        indexer = Indexer(ram_buffer_mb=256)
         data_file_path = input("Path to the file to be indexed: ")
-        indexer.index_data(data_file_path)
+        indexer.index_data(data_file_path, num_threads=os.cpu_count(), force_merge_segments=1)
         continue_query = input("Indexing finished. Do you wish to proceed to queries? Y/N: ")
 
         if continue_query == "Y":
@@ -158,18 +609,19 @@ if __name__ == "__main__":
         else:
             quit()
 
+    searcher = Searcher()
     while start_choice == "2":
         or_and = str(input("Is your next query using OR or AND searcher? [OR/AND] "))
         query = str(input("\tEnter your query: "))
         number_of_results = int(input("\t\tHow many results do you wish? "))
         results = []
         if or_and == "OR":
-            results = indexer.search_documents_or(query, number_of_results)
+            results = searcher.search_documents_or(query, number_of_results)
         elif or_and == "AND":
-            results = indexer.search_documents_and(query, number_of_results)
+            results = searcher.search_documents_and(query, number_of_results)
         else:
             quit()
-        indexer.print_results(results)
+        Indexer.print_results(results)
         repeat = input("Do you wish to create another query? Y/N: ")
         if repeat != "Y":
             quit()
@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+
+# Queries sent when no query file is given, one "MODE<TAB>query" per line in the file
+DEFAULT_QUERIES = [
+    ("AND", "Title:Ysera"),
+    ("OR", "Title:Aberrus"),
+    ("AND", "Title:Sarkareth AND Paragraphs_content:Aberrus"),
+    ("OR", "Title:Sarkareth OR Wiki:Aberrus"),
+    ("AND", "Title:Ysera AND Paragraphs_content:green AND Lists_content:Eye"),
+    ("OR", "Title:Illidan OR Wiki:fel"),
+    ("OR", "Paragraphs_content:dragon OR Lists_content:Loot"),
+]
+
+
+# Load generator class -> sends queries to the search server from several client threads and measures latency
+# of every request
+class LoadGenerator:
+    # Constructor
+    # @param server_url <str>: search endpoint of the server; e.g. "http://127.0.0.1:8080/search"
+    # @param queries <list>: (mode, query) pairs sent in turn
+    # @param concurrency <int>: number of concurrent clients
+    # @param number_of_results <int>: k of every query
+    def __init__(self, server_url, queries=DEFAULT_QUERIES, concurrency=8, number_of_results=10):
+        self.server_url = server_url
+        self.queries = queries
+        self.concurrency = concurrency
+        self.number_of_results = number_of_results
+        self.sessions = threading.local()
+
+    # Sends one query and returns its latency in seconds, or None if the request failed
+    # @param index <int>: number of the request, selects the query
+    def send_query(self, index):
+        if getattr(self.sessions, "session", None) is None:
+            self.sessions.session = requests.Session()
+
+        mode, query = self.queries[index % len(self.queries)]
+        start_time = time.perf_counter()
+        try:
+            response = self.sessions.session.post(self.server_url, timeout=30,
+                                                  json={"query": query, "mode": mode, "k": self.number_of_results})
+        except requests.RequestException:
+            return None
+
+        return time.perf_counter() - start_time if response.status_code == 200 else None
+
+    # Sends the requests and prints p50/p99 latency and throughput
+    # @param number_of_requests <int>: number of requests sent in total
+    # @return <dict>: measured statistics
+    def run(self, number_of_requests=1000):
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            latencies = list(executor.map(self.send_query, range(number_of_requests)))
+        elapsed = time.perf_counter() - start_time
+
+        successful = np.array([latency for latency in latencies if latency is not None]) * 1000
+        statistics = {
+            "requests": number_of_requests,
+            "errors": number_of_requests - len(successful),
+            "qps": len(successful) / elapsed,
+            "p50_ms": float(np.percentile(successful, 50)) if len(successful) else None,
+            "p99_ms": float(np.percentile(successful, 99)) if len(successful) else None,
+        }
+
+        print(f"{statistics['requests']} requests, {statistics['errors']} errors, {self.concurrency} clients")
+        if len(successful):
+            print(f"QPS: {statistics['qps']:.1f}  p50: {statistics['p50_ms']:.2f} ms  p99: {statistics['p99_ms']:.2f} ms")
+
+        return statistics
+
+
+if __name__ == "__main__":
+    # Usage: python LoadGenerator.py [server_url] [number_of_requests] [concurrency] [query_file]
+    server_url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8080/search"
+    number_of_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    queries = DEFAULT_QUERIES
+    if len(sys.argv) > 4:
+        with open(sys.argv[4], encoding="utf-8") as query_file:
+            queries = [tuple(line.rstrip("\n").split("\t", 1)) for line in query_file if line.strip()]
+
+    LoadGenerator(server_url, queries, concurrency).run(number_of_requests)
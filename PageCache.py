@@ -0,0 +1,72 @@
+import sqlite3
+from CrawlState import CrawlState
+
+
+# Page cache class -> remembers validators (ETag, Last-Modified), content hash, title, store key, links and SimHash
+# fingerprint of every downloaded page in an SQLite database, so a re-crawl can send conditional requests and skip unchanged pages
+# Pages changed by the current crawl are recorded in the same database, so they are committed together with the
+# cached hashes and a resumed crawl still lists pages it saved before it was killed
+class PageCache(CrawlState):
+
+    # Constructor
+    # @param cache_path <str>: path to the SQLite file with the cache; e.g. "page_cache.sqlite"
+    def __init__(self, cache_path):
+        super().__init__(cache_path)
+        self.database.row_factory = sqlite3.Row
+        self.database.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                title TEXT,
+                page_key TEXT,
+                links TEXT
+            );
+        """)
+
+        # Caches created before fingerprints were cached get the column, their pages are fingerprinted when changed
+        if "fingerprint" not in [column["name"] for column in self.database.execute("PRAGMA table_info(pages)")]:
+            self.database.execute("ALTER TABLE pages ADD COLUMN fingerprint TEXT")
+            self.database.commit()
+
+    # Returns cached information about the page on given url as a dictionary, or None if the page was never downloaded
+    # @param url <str>: normalized relative url; e.g. "/wiki/Ysera"
+    def get(self, url):
+        row = self.database.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+
+        page = dict(row)
+        page["links"] = page["links"].split("\n") if page["links"] else []
+        page["fingerprint"] = int(page["fingerprint"], 16) if page["fingerprint"] else None
+        return page
+
+    # Stores information about the page on given url, replacing the previous one
+    # @param url <str>: normalized relative url; e.g. "/wiki/Ysera"
+    # @param etag <str>: value of the ETag response header or None
+    # @param last_modified <str>: value of the Last-Modified response header or None
+    # @param content_hash <str>: hash of the extracted content of the page
+    # @param title <str>: main title of the page
+    # @param page_key <str>: key under which the page's HTML is saved in the page store
+    # @param links <list>: relative links found on the page
+    # @param fingerprint <int>: 64-bit SimHash fingerprint of the page or None; stored as hex, as SQLite integers are signed
+    def put(self, url, etag, last_modified, content_hash, title, page_key, links, fingerprint=None):
+        self.database.execute("INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, title, page_key, "
+                              "links, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              (url, etag, last_modified, content_hash, title, page_key, "\n".join(links),
+                               format(fingerprint, "016x") if fingerprint is not None else None))
+
+    # Forgets the page on given url, e.g. after it was deleted from the wiki
+    # @param url <str>: normalized relative url; e.g. "/wiki/Ysera"
+    def delete(self, url):
+        self.database.execute("DELETE FROM pages WHERE url = ?", (url,))
+
+    # Persists all changes
+    def commit(self):
+        self.database.commit()
+
+    # Persists all changes and closes the database
+    def close(self):
+        self.database.commit()
+        self.database.close()
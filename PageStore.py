@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import os
+import re
+import sys
+
+
+# Page store class -> WARC-like store of crawled pages; every page is appended as one gzip-compressed record to one
+# of a few large segment files and an append-only TSV index maps the page's key, url and title to its record
+# Records can be read one by one by key, url or title, or all of them in one sequential pass over the segments
+class PageStore:
+    INDEX_HEADER = "Key\tUrl\tTitle\tSegment\tOffset\tLength\tDigest\n"
+
+    # Constructor
+    # @param store_path <str>: path to directory with segment files and index; e.g. "crawled_data"
+    # @param max_segment_size <int>: size in bytes after which a new segment file is started; e.g. 256 MB
+    def __init__(self, store_path, max_segment_size=256 * 1024 * 1024):
+        self.store_path = store_path
+        self.max_segment_size = max_segment_size
+        self.index_path = f"{store_path}/index.tsv"
+        if not os.path.exists(store_path):
+            os.makedirs(store_path)
+
+        self.entries = {}
+        self.keys_by_url = {}
+        self.keys_by_title = {}
+        if os.path.exists(self.index_path):
+            self.read_index()
+
+        self.segment = max([entry["segment"] for entry in self.entries.values()], default=0)
+        self.segment_file = None
+        self.index_file = None
+
+    # Loads the index into memory; later lines supersede earlier lines with the same key, lines with segment -1 delete
+    # the page; a last line without newline was cut short by a crash while it was written, so it is dropped and the
+    # file is truncated before it, otherwise the next appended line would be glued to it
+    def read_index(self):
+        with open(self.index_path, "rb") as index_file:
+            lines = index_file.readlines()
+
+        if not lines or not lines[0].endswith(b"\n"):
+            os.remove(self.index_path)
+            return
+
+        if not lines[-1].endswith(b"\n"):
+            with open(self.index_path, "r+b") as index_file:
+                index_file.truncate(sum(len(line) for line in lines[:-1]))
+            lines.pop()
+
+        for line in lines[1:]:
+            key, url, title, segment, offset, length, digest = line.decode("utf-8").rstrip("\r\n").split("\t")
+            if int(segment) < 0:
+                self.remove_entry(key)
+            else:
+                self.add_entry(key, url, title, int(segment), int(offset), int(length), digest)
+
+    # Returns number of pages in the store
+    def __len__(self):
+        return len(self.entries)
+
+    # Returns True if a page with given key is in the store
+    # @param key <str>: key of the page; e.g. "Ysera - Warcraft Wiki_12"
+    def __contains__(self, key):
+        return key in self.entries
+
+    # Returns path to the segment file with given number
+    # @param segment <int>: number of the segment
+    def segment_path(self, segment):
+        return f"{self.store_path}/segment_{segment:05d}.gz"
+
+    # Registers a record in the in-memory index
+    def add_entry(self, key, url, title, segment, offset, length, digest):
+        self.entries[key] = {"key": key, "url": url, "title": title, "segment": segment, "offset": offset,
+                             "length": length, "digest": digest}
+        if url:
+            self.keys_by_url[url] = key
+        if title:
+            self.keys_by_title[title] = key
+
+    # Removes a record from the in-memory index
+    def remove_entry(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        if self.keys_by_url.get(entry["url"]) == key:
+            del self.keys_by_url[entry["url"]]
+        if self.keys_by_title.get(entry["title"]) == key:
+            del self.keys_by_title[entry["title"]]
+
+    # Opens the index for appending, writing its header if it is new
+    def open_index(self):
+        if self.index_file is not None:
+            return
+
+        is_new_index = not os.path.exists(self.index_path)
+        self.index_file = open(self.index_path, "a", encoding="utf-8")
+        if is_new_index:
+            self.index_file.write(self.INDEX_HEADER)
+
+    # Opens the current segment for appending, starting a new one once it reaches max_segment_size
+    def open_segment(self):
+        if self.segment_file is not None and self.segment_file.tell() < self.max_segment_size:
+            return
+
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment += 1
+
+        self.segment_file = open(self.segment_path(self.segment), "ab")
+        if self.segment_file.tell() >= self.max_segment_size:
+            self.segment_file.close()
+            self.segment += 1
+            self.segment_file = open(self.segment_path(self.segment), "ab")
+
+    # Appends a page to the store; a page stored under an existing key replaces the previous version
+    # @param key <str>: key of the page; e.g. "Ysera - Warcraft Wiki_12"
+    # @param url <str>: relative url of the page; e.g. "/wiki/Ysera"
+    # @param title <str>: main title of the page; e.g. "Ysera"
+    # @param document <str>: HTML of the page
+    def put(self, key, url, title, document):
+        key, url, title = [re.sub(r"[\t\r\n]", " ", value) for value in (key, url, title)]
+        body = document.encode("utf-8")
+        record = gzip.compress(f"Key: {key}\nUrl: {url}\nTitle: {title}\n\n".encode("utf-8") + body)
+
+        self.open_segment()
+        offset = self.segment_file.tell()
+        self.segment_file.write(record)
+        self.segment_file.flush()
+
+        self.open_index()
+        digest = hashlib.sha1(body).hexdigest()
+        self.index_file.write(f"{key}\t{url}\t{title}\t{self.segment}\t{offset}\t{len(record)}\t{digest}\n")
+        self.index_file.flush()
+        self.add_entry(key, url, title, self.segment, offset, len(record), digest)
+
+    # Deletes the page stored under given key; its record stays in the segment until the store is rewritten
+    # @param key <str>: key of the page; e.g. "Ysera - Warcraft Wiki_12"
+    def delete(self, key):
+        if key not in self.entries:
+            return
+
+        self.open_index()
+        self.index_file.write(f"{key}\t\t\t-1\t0\t0\t\n")
+        self.index_file.flush()
+        self.remove_entry(key)
+
+    # Decompresses a record and returns the HTML document stored in it
+    # @param record <bytes>: compressed record
+    def decode_record(self, record):
+        return gzip.decompress(record).split(b"\n\n", 1)[1].decode("utf-8")
+
+    # Returns the HTML document stored in the record of given index entry
+    # @param entry <dict>: index entry of the page, as returned by iter_entries
+    def read_entry(self, entry):
+        with open(self.segment_path(entry["segment"]), "rb") as segment_file:
+            segment_file.seek(entry["offset"])
+            return self.decode_record(segment_file.read(entry["length"]))
+
+    # Returns the HTML document stored under given key
+    # @param key <str>: key of the page; e.g. "Ysera - Warcraft Wiki_12"
+    def get(self, key):
+        return self.read_entry(self.entries[key])
+
+    # Returns the HTML document of the page crawled from given url
+    # @param url <str>: relative url of the page; e.g. "/wiki/Ysera"
+    def get_by_url(self, url):
+        return self.get(self.keys_by_url[url])
+
+    # Returns the HTML document of the page with given main title
+    # @param title <str>: main title of the page; e.g. "Ysera"
+    def get_by_title(self, title):
+        return self.get(self.keys_by_title[title])
+
+    # Returns index entries of all pages ordered by their position in the segments
+    def iter_entries(self):
+        return iter(sorted(self.entries.values(), key=lambda entry: (entry["segment"], entry["offset"])))
+
+    # Generator yielding (index entry, HTML document) of every page in one sequential pass over the segments;
+    # records superseded by a newer version of the same page are skipped
+    def iter_pages(self):
+        segment, segment_file = None, None
+        for entry in self.iter_entries():
+            if entry["segment"] != segment:
+                if segment_file is not None:
+                    segment_file.close()
+                segment = entry["segment"]
+                segment_file = open(self.segment_path(segment), "rb")
+
+            if segment_file.tell() != entry["offset"]:
+                segment_file.seek(entry["offset"])
+            yield entry, self.decode_record(segment_file.read(entry["length"]))
+
+        if segment_file is not None:
+            segment_file.close()
+
+    # Closes the opened segment and index files
+    def close(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+            self.segment_file = None
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+
+# Imports a directory of HTML files saved by older versions of the crawler into a page store
+if __name__ == "__main__":
+    html_directory_path, store_path = sys.argv[1], sys.argv[2]
+    store = PageStore(store_path)
+
+    for file_name in os.listdir(html_directory_path):
+        with open(f"{html_directory_path}/{file_name}", "r", encoding="utf-8") as file:
+            store.put(os.path.splitext(file_name)[0], "", "", file.read())
+
+    store.close()
+    print(f"Imported {len(store)} pages into {store_path}")
@@ -1,12 +1,20 @@
 import os
 import re
+import sys
+import time
+from multiprocessing import Pool
+from PageStore import PageStore
+from HtmlExtractor import HtmlExtractor
+from CorpusStore import CorpusReader, CorpusWriter
 
 
 # Class which offers numerous parsing methods
 class Parser:
 
+    FLAGS = re.I | re.M | re.DOTALL
+
     # Contructor
-    # Creates regex patterns
+    # Creates regex patterns and compiles them once, so no call goes through the re module's pattern cache
     def __init__(self):
         self.html_paragraph_pattern = r"<p[^>]*>(.*?)<\/p>"
         self.html_tag_pattern = r"<.*?>"
@@ -30,20 +38,51 @@ class Parser:
         self.wiki_links_pattern = r"\"?\'?\[http[^]]+\]\"?\'?"
         self.wiki_headings_pattern = r"\=+[^\=]+\=+"
         self.wiki_ctg_file_text_pattern = r"(?:File|Category)\:.+?$\n?"
+        self.curly_brackets_pattern = r"[{}]"
+        self.wiki_double_curly_brackets_pattern = r"\{\{|\}\}"
+        self.wiki_double_square_brackets_pattern = r"\[\[|\]\]"
+        self.wiki_ctg_file_prefix_pattern = r"(?:Category|File)\:(?=[^\]])"
+        self.wiki_blockquote_prefix_pattern = r"blockquote\|"
+
+        self.html_paragraph_regex = re.compile(self.html_paragraph_pattern, self.FLAGS)
+        self.html_tag_regex = re.compile(self.html_tag_pattern, self.FLAGS)
+        self.html_special_character_regex = re.compile(self.html_special_character_pattern, self.FLAGS)
+        self.html_main_regex = re.compile(self.html_main_pattern, self.FLAGS)
+        self.list_regex = re.compile(self.list_pattern, self.FLAGS)
+        self.citation_regex = re.compile(self.citation_pattern, self.FLAGS)
+        self.main_title_regex = re.compile(self.main_title_pattern, self.FLAGS)
+        self.main_title_alternative_regex = re.compile(self.main_title_alternative_pattern, self.FLAGS)
+        self.dot_citation_regex = re.compile(self.dot_citation_pattern, self.FLAGS)
+        self.leftover_citation_regex = re.compile(self.leftover_citation_pattern, self.FLAGS)
+        self.new_line_regex = re.compile(self.new_line_pattern, self.FLAGS)
+        self.tab_regex = re.compile(self.tab_pattern, self.FLAGS)
+        self.return_regex = re.compile(self.return_pattern, self.FLAGS)
+        self.wiki_citation_regex = re.compile(self.wiki_citation_pattern, self.FLAGS)
+        self.wiki_blockquote_regex = re.compile(self.wiki_blockquote_pattern, self.FLAGS)
+        self.wiki_blockquote_content_regex = re.compile(self.wiki_blockquote_content_pattern, self.FLAGS)
+        self.wiki_ctg_file_regex = re.compile(self.wiki_ctg_file_pattern, self.FLAGS)
+        self.wiki_brackets_apostrophes_regex = re.compile(self.wiki_brackets_apostrophes_pattern, self.FLAGS)
+        self.wiki_links_regex = re.compile(self.wiki_links_pattern, self.FLAGS)
+        self.wiki_headings_regex = re.compile(self.wiki_headings_pattern, self.FLAGS)
+        self.wiki_ctg_file_text_regex = re.compile(self.wiki_ctg_file_text_pattern, self.FLAGS)
+        self.curly_brackets_regex = re.compile(self.curly_brackets_pattern)
+        self.wiki_double_curly_brackets_regex = re.compile(self.wiki_double_curly_brackets_pattern)
+        self.wiki_double_square_brackets_regex = re.compile(self.wiki_double_square_brackets_pattern)
+        self.wiki_ctg_file_prefix_regex = re.compile(self.wiki_ctg_file_prefix_pattern, self.FLAGS)
+        self.wiki_blockquote_prefix_regex = re.compile(self.wiki_blockquote_prefix_pattern, self.FLAGS)
 
     # Given an HTML document, returns all paragraphs in it
     # @param document <str>: content of the HTML file
     def get_paragraphs(self, document):
-        return re.findall(self.html_paragraph_pattern, document, flags=re.I | re.M | re.DOTALL)
+        return self.html_paragraph_regex.findall(document)
 
     # Given an HTML document, returns the main title of the page
     # @param document <str>: content of the HTML file
     def get_main_title(self, document):
-        main_title = re.search(self.main_title_pattern, document, flags=re.I | re.M | re.DOTALL)
+        main_title = self.main_title_regex.search(document)
 
         if main_title is None:
-            main_title = \
-            re.search(self.main_title_alternative_pattern, document, flags=re.I | re.M | re.DOTALL).groups()[0]
+            main_title = self.main_title_alternative_regex.search(document).groups()[0]
             main_title = self.remove_html_tags(main_title)
             return main_title
 
@@ -52,87 +91,161 @@ class Parser:
     # Given a wiki document, returns the document cleared of wiki headings
     # @param document <str>: page from wiki dump
     def remove_wiki_headings(self, document):
-        return re.sub(self.wiki_headings_pattern, "", document, flags=re.I | re.M | re.DOTALL)
+        return self.wiki_headings_regex.sub("", document)
 
     # Given a wiki document, returns the document cleared of custom categories and file mentions from text
     # @param document <str>: page from wiki dump
     def remove_wiki_ctg_file_text(self, document):
-        return re.sub(self.wiki_ctg_file_text_pattern, "", document, flags=re.I | re.M | re.DOTALL)
+        return self.wiki_ctg_file_text_regex.sub("", document)
 
     # Given an HTML document, returns the content of lists inside page's main content
     # @param document <str>: content of the HTML file
     def get_html_list_text(self, document):
-        main_content = re.search(self.html_main_pattern, document, flags=re.I | re.M | re.DOTALL).groups()[0]
-        return re.findall(self.list_pattern, main_content, flags=re.I | re.M | re.DOTALL)
+        main_content = self.html_main_regex.search(document).groups()[0]
+        return self.list_regex.findall(main_content)
 
-    # Given a wiki document, returns the document cleared of custom categories and file tags
+    # Given a wiki document, returns the document cleared of custom categories and file tags, including the links
+    # nested in their captions; e.g. "[[File:Ysera.jpg|thumb|[[Ysera]] asleep]]"
     # @param document <str>: page from wiki dump
     def remove_wiki_ctg_file_tags(self, document):
-        return re.sub(self.wiki_ctg_file_pattern, "", document, flags=re.I | re.M | re.DOTALL)
+        return self.rewrite_nested_wiki_markup(document, self.wiki_double_square_brackets_regex, "[[",
+                                               self.wiki_ctg_file_prefix_regex, keep_content=False)
 
     # Given a wiki document, returns the document cleared of wiki citations
     # @param document <str>: page from wiki dump
     def remove_wiki_citations(self, document):
-        return re.sub(self.wiki_citation_pattern, "", document, flags=re.I | re.M | re.DOTALL)
+        return self.wiki_citation_regex.sub("", document)
 
     # Given a wiki document, returns the document cleared of nested curly brackets
+    # Single stack-based pass: every "{" pushes the position of its chunk, every matching "}" drops all chunks from
+    # there on, so each character is appended and dropped at most once; unbalanced brackets are kept as they are,
+    # exactly like removing innermost "{...}" groups until nothing changes
     # @param document <str>: page from wiki dump
     def remove_text_between_nested_curly_brackets(self, document):
-        n = 1
-        while n:
-            document, n = re.subn(r'\{[^{}]*\}', '', document)
-        return document
+        chunks = []
+        open_brackets = []
+        position = 0
+        for bracket in self.curly_brackets_regex.finditer(document):
+            chunks.append(document[position:bracket.start()])
+            position = bracket.end()
+            if bracket.group() == "{":
+                open_brackets.append(len(chunks))
+                chunks.append("{")
+            elif open_brackets:
+                del chunks[open_brackets.pop():]
+            else:
+                chunks.append("}")
+
+        chunks.append(document[position:])
+        return "".join(chunks)
+
+    # Given a wiki document, rewrites nested constructs like "{{name|...}}" or "[[name:...]]" in one stack-based pass
+    # Constructs whose opening token is followed by prefix are either removed whole, together with everything nested
+    # in them, or unwrapped, keeping their content without the opening token, prefix and closing token; other
+    # constructs and unbalanced tokens are kept as they are, so the runtime is linear in the length of the document
+    # @param document <str>: page from wiki dump
+    # @param token_regex <Pattern>: compiled regex matching the opening and closing tokens; e.g. "\{\{|\}\}"
+    # @param opening <str>: opening token; e.g. "{{"
+    # @param prefix_regex <Pattern>: compiled regex matched right after the opening token; e.g. "blockquote\|"
+    # @param keep_content <bool>: True unwraps matching constructs, False removes them
+    def rewrite_nested_wiki_markup(self, document, token_regex, opening, prefix_regex, keep_content):
+        chunks = []
+        open_constructs = []
+        position = 0
+        for token in token_regex.finditer(document):
+            if token.start() < position:
+                continue
+            chunks.append(document[position:token.start()])
+
+            if token.group() == opening:
+                prefix = prefix_regex.match(document, token.end())
+                position = prefix.end() if prefix is not None else token.end()
+                open_constructs.append((len(chunks), prefix is not None))
+                chunks.append(document[token.start():position])
+                continue
+
+            position = token.end()
+            if not open_constructs:
+                chunks.append(token.group())
+                continue
+
+            start, is_matching = open_constructs.pop()
+            if not is_matching:
+                chunks.append(token.group())
+            elif keep_content:
+                chunks[start] = ""
+            else:
+                del chunks[start:]
+
+        chunks.append(document[position:])
+        return "".join(chunks)
 
     # Given a wiki document, returns the document cleared of apostrophe & brackets pattern inside the wiki
     # @param document <str>: page from wiki dump
     def edit_wiki_brackets_apostrophes(self, document):
-        return re.sub(self.wiki_brackets_apostrophes_pattern, "", document, flags=re.I | re.M | re.DOTALL)
+        return self.wiki_brackets_apostrophes_regex.sub("", document)
 
     # Given a wiki document, returns the document cleared of wiki links
     # @param document <str>: page from wiki dump
     def remove_wiki_links(self, document):
-        return re.sub(self.wiki_links_pattern, "", document, flags=re.I | re.M | re.DOTALL)
+        return self.wiki_links_regex.sub("", document)
 
-    # Given a wiki document, returns the document with blockquotes cleared of wiki syntax
+    # Given a wiki document, returns the document with blockquotes cleared of wiki syntax; the quoted text is kept,
+    # templates nested inside the quote are left for remove_text_between_nested_curly_brackets
     # @param document <str>: page from wiki dump
     def edit_wiki_blockquotes(self, document):
-        quote = re.search(self.wiki_blockquote_content_pattern, document, flags=re.I | re.M | re.DOTALL)
-        return re.sub(self.wiki_blockquote_pattern,
-                      quote.group(0) if quote is not None else "",
-                      document,
-                      flags=re.I | re.M | re.DOTALL)
+        return self.rewrite_nested_wiki_markup(document, self.wiki_double_curly_brackets_regex, "{{",
+                                               self.wiki_blockquote_prefix_regex, keep_content=True)
 
     # Given a text, returns text cleared of html tags
     # @param text <str>: text to process
     def remove_html_tags(self, text):
-        return re.sub(self.html_tag_pattern, "", text, flags=re.I | re.M | re.DOTALL)
+        return self.html_tag_regex.sub("", text)
 
     # Given a text, returns text cleared of special html characters
     # @param text <str>: text to process
     def remove_html_special_characters(self, text):
-        return re.sub(self.html_special_character_pattern, "", text, flags=re.I | re.M | re.DOTALL)
+        return self.html_special_character_regex.sub("", text)
 
     # Given a text, returns text cleared of citations
     # @param text <str>: text to process
     def remove_citations(self, text):
-        text = re.sub(self.citation_pattern, "", text, flags=re.I | re.M | re.DOTALL)
-        text = re.sub(self.dot_citation_pattern, "", text, flags=re.I | re.M | re.DOTALL)
-        return re.sub(self.leftover_citation_pattern, "", text, flags=re.I | re.M | re.DOTALL)
+        text = self.citation_regex.sub("", text)
+        text = self.dot_citation_regex.sub("", text)
+        return self.leftover_citation_regex.sub("", text)
 
     # Given a text, returns text cleared of new lines
     # @param text <str>: text to process
     def remove_new_lines(self, text):
-        return re.sub(self.new_line_pattern, "", text, flags=re.I | re.M | re.DOTALL)
+        return self.new_line_regex.sub("", text)
 
     # Given a text, returns text cleared of tabulators
     # @param text <str>: text to process
     def remove_tabs(self, text):
-        return re.sub(self.tab_pattern, "", text, flags=re.I | re.M | re.DOTALL)
+        return self.tab_regex.sub("", text)
 
     # Given a text, returns text cleared of escape return characters
     # @param text <str>: text to process
     def remove_returns(self, text):
-        return re.sub(self.return_pattern, "", text, flags=re.I | re.M | re.DOTALL)
+        return self.return_regex.sub("", text)
+
+    # Given a paragraph or list fragment of an HTML document, returns it cleared of citations, html tags, special
+    # html characters, new lines, tabulators and escape return characters; produces exactly the same text as calling
+    # remove_citations, remove_html_tags, remove_html_special_characters, remove_new_lines, remove_tabs and
+    # remove_returns one after another, but every regex pass is skipped when the character all its matches start
+    # with is missing from the text, and control characters are removed by plain str.replace instead of regexes
+    # @param text <str>: text to process
+    def clean_html_text(self, text):
+        if "#" in text:
+            text = self.citation_regex.sub("", text)
+            text = self.dot_citation_regex.sub("", text)
+        if "[" in text:
+            text = self.leftover_citation_regex.sub("", text)
+        if "<" in text:
+            text = self.html_tag_regex.sub("", text)
+        if "&" in text:
+            text = self.html_special_character_regex.sub("", text)
+        return text.replace("\n", "").replace("\t", "").replace("\r", "")
 
     # Given an HTML document, returns cleaned content of the document
     # @param document <str>: document to clean
@@ -140,14 +253,7 @@ class Parser:
         clean_paragraphs = []
         paragraphs = self.get_paragraphs(document)
         for paragraph in paragraphs:
-            clean_paragraph = self.remove_citations(paragraph)
-            clean_paragraph = self.remove_html_tags(clean_paragraph)
-            clean_paragraph = self.remove_html_special_characters(clean_paragraph)
-            clean_paragraph = self.remove_new_lines(clean_paragraph)
-            clean_paragraph = self.remove_tabs(clean_paragraph)
-            clean_paragraph = self.remove_returns(clean_paragraph)
-
-            clean_paragraphs.append(clean_paragraph)
+            clean_paragraphs.append(self.clean_html_text(paragraph))
 
         return clean_paragraphs
 
@@ -157,45 +263,117 @@ class Parser:
         clean_lists = []
         lists = self.get_html_list_text(document)
         for list in lists:
-            clean_list = self.remove_citations(list)
-            clean_list = self.remove_html_tags(clean_list)
-            clean_list = self.remove_html_special_characters(clean_list)
-            clean_list = self.remove_new_lines(clean_list)
-            clean_list = self.remove_tabs(clean_list)
-            clean_list = self.remove_returns(clean_list)
-
-            clean_lists.append(clean_list)
+            clean_lists.append(self.clean_html_text(list))
 
         return clean_lists
 
+    # Given an HTML document, returns its page title, main title, cleaned paragraphs, cleaned lists and wiki links
+    # extracted in one streaming pass, without the backtracking regexes of get_paragraphs and get_html_list_text
+    # @param document <str>: content of the HTML file
+    def extract_page(self, document):
+        return HtmlExtractor().extract(document)
 
-if __name__ == "__main__":
-    # Create parser object
-    parser = Parser()
+    # Given an HTML document, returns its main title, cleaned paragraphs and cleaned lists as one row of parsed data
+    # @param document <str>: content of the HTML file
+    def parse_page(self, document):
+        page = self.extract_page(document)
+        return page.main_title, " ".join(page.paragraphs), " ".join(page.lists)
 
-    crawled_data_path = "crawled_data"
-    parsed_data_output_directory = "."
 
-    # Open file where parsed data will be stored & create header
-    f_w = open(f"{parsed_data_output_directory}/parsed.tsv", "w", encoding="utf-8")
-    f_w.write("Title\tParagraphs_content\tLists_content\n")
+# Parser and page store of one worker process of the parse pool
+worker_parser = None
+worker_page_store = None
+
 
-    # Lists all the HTML in the directory
-    ls = os.listdir(crawled_data_path)
+# Initializes a worker process of the parse pool, the page store index is loaded once per process
+# @param crawled_data_path <str>: path to the page store; e.g. "crawled_data"
+def init_parse_worker(crawled_data_path):
+    global worker_parser, worker_page_store
+    worker_parser = Parser()
+    worker_page_store = PageStore(crawled_data_path)
 
-    current_file_numer = 1
-    for file_name in ls:
-        file = open(fr"{crawled_data_path}/{file_name}", "r", encoding="utf-8")
-        file_content = file.read()
 
-        # Get main title of the document
-        main_page_title = parser.get_main_title(file_content)
+# Reads and parses one page in a worker process; only the small index entry travels to the worker and only
+# the parsed row travels back
+# @param entry <dict>: index entry of the page in the page store
+def parse_page_entry(entry):
+    return worker_parser.parse_page(worker_page_store.read_entry(entry))
 
-        print(f"[{current_file_numer}]: {main_page_title}")
-        current_file_numer += 1
 
-        parsed_paragraphs = " ".join(parser.parse_paragraphs(file_content))
-        parsed_lists = " ".join(parser.parse_lists(file_content))
-        f_w.write(f"{main_page_title if main_page_title is not None else ''}\t{parsed_paragraphs}\t{parsed_lists}\n")
+# Reads the manifest of a previous parse; it maps key of every parsed page to the digest of its HTML and
+# to the location (batch number, row number in the batch) of its row in parsed.arrow
+# @param manifest_path <str>: path to the manifest; e.g. "parsed_manifest.tsv"
+def read_parse_manifest(manifest_path):
+    manifest = {}
+    with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+        next(manifest_file)
+        for line in manifest_file:
+            key, digest, batch_number, row_number = line.rstrip("\n").split("\t")
+            manifest[key] = (digest, int(batch_number), int(row_number))
+    return manifest
 
-        file.close()
+
+if __name__ == "__main__":
+    crawled_data_path = "crawled_data"
+    parsed_data_output_directory = "."
+    processes = os.cpu_count()
+
+    parsed_data_path = f"{parsed_data_output_directory}/parsed.arrow"
+    manifest_path = f"{parsed_data_output_directory}/parsed_manifest.tsv"
+
+    # Incremental mode: with the manifest of a previous run, only new and changed pages are parsed, rows of
+    # unchanged pages are copied from the previous parsed.arrow and rows of pages no longer in the store are dropped;
+    # "--full" forces parsing of all pages
+    previous_manifest = {}
+    if "--full" not in sys.argv and os.path.exists(manifest_path) and os.path.exists(parsed_data_path):
+        previous_manifest = read_parse_manifest(manifest_path)
+
+    entries = list(PageStore(crawled_data_path).iter_entries())
+    changed_entries = [entry for entry in entries
+                       if previous_manifest.get(entry["key"], (None,))[0] != entry["digest"]]
+    print(f"{len(changed_entries)} of {len(entries)} pages are new or changed")
+
+    # New files are written aside and replace the old ones only when complete
+    f_w = CorpusWriter(f"{parsed_data_path}.tmp", ["Title", "Paragraphs_content", "Lists_content"])
+    f_m = open(f"{manifest_path}.tmp", "w", encoding="utf-8")
+    f_m.write("Key\tDigest\tBatch\tRow\n")
+    f_previous = CorpusReader(parsed_data_path) if previous_manifest else None
+
+    # Pages are parsed in chunks by a pool of processes; imap streams the rows back in the order of the page store,
+    # so parsed.arrow is the same on every run regardless of the number of processes
+    chunk_size = max(1, min(64, len(changed_entries) // (processes * 8)))
+    start_time = time.perf_counter()
+
+    with Pool(processes, initializer=init_parse_worker, initargs=(crawled_data_path,)) as pool:
+        parsed_rows = pool.imap(parse_page_entry, changed_entries, chunk_size)
+
+        current_file_numer = 1
+        reused_rows = 0
+        for entry in entries:
+            previous_row = previous_manifest.get(entry["key"])
+            if previous_row is not None and previous_row[0] == entry["digest"]:
+                row = f_previous.read_row(previous_row[1], previous_row[2])
+                reused_rows += 1
+            else:
+                row = next(parsed_rows)
+
+                print(f"[{current_file_numer}]: {row[0]}")
+                if current_file_numer % 1000 == 0:
+                    print(f"{current_file_numer / (time.perf_counter() - start_time):.1f} files/s")
+                current_file_numer += 1
+
+            batch_number, row_number = f_w.write_row(row)
+            f_m.write(f"{entry['key']}\t{entry['digest']}\t{batch_number}\t{row_number}\n")
+
+    f_w.close()
+    f_m.close()
+    if f_previous is not None:
+        f_previous.close()
+    os.replace(f"{parsed_data_path}.tmp", parsed_data_path)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    elapsed_time = time.perf_counter() - start_time
+    parsed_files = len(changed_entries)
+    dropped_rows = len(previous_manifest.keys() - {entry["key"] for entry in entries})
+    print(f"Parsed {parsed_files} files in {elapsed_time:.1f}s ({parsed_files / max(elapsed_time, 1e-9):.1f} files/s) "
+          f"using {processes} processes; reused {reused_rows} rows, dropped {dropped_rows} rows of deleted pages")
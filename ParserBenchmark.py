@@ -0,0 +1,90 @@
+import os
+import random
+import re
+import sys
+import time
+from Parser import Parser
+from PageStore import PageStore
+
+
+# Cleans a fragment the way Parser did before the cleaning engine: one full pass per cleaning method, every pass
+# calling re.sub with the pattern string, so the pattern is looked up in the re module's cache on each call
+# @param parser <Parser>: parser holding the pattern strings
+# @param text <str>: paragraph or list fragment
+def legacy_clean(parser, text):
+    for pattern in (parser.citation_pattern, parser.dot_citation_pattern, parser.leftover_citation_pattern,
+                    parser.html_tag_pattern, parser.html_special_character_pattern, parser.new_line_pattern,
+                    parser.tab_pattern, parser.return_pattern):
+        text = re.sub(pattern, "", text, flags=re.I | re.M | re.DOTALL)
+    return text
+
+
+# Generates HTML fragments resembling paragraphs and lists of the crawled wiki
+# @param number_of_fragments <int>: number of fragments to generate
+def generate_fragments(number_of_fragments):
+    random.seed(42)
+    words = ["Ysera", "the", "Dreamer", "green", "dragon", "Aspect", "of", "Emerald", "Dream", "Azeroth", "Nightmare"]
+    pieces = ['<a href="/wiki/Ysera" title="Ysera">Ysera</a>', "<b>Aspect</b>", "&#160;", "&amp;", "\n", "\t",
+              '<sup><a href="#cite_note-3">[3]</a></sup>', "[12]", "<i>Dragonflight</i>"]
+
+    fragments = []
+    for _ in range(number_of_fragments):
+        tokens = [random.choice(pieces) if random.random() < 0.15 else random.choice(words) for _ in range(120)]
+        fragments.append(" ".join(tokens))
+    return fragments
+
+
+# Generates HTML documents resembling pages of the crawled wiki: a header and navigation shared by all pages and a
+# <main> element with the title, paragraphs and lists built of the generated fragments
+# @param number_of_pages <int>: number of pages to generate
+def generate_pages(number_of_pages):
+    fragments = generate_fragments(number_of_pages * 12)
+    navigation = "".join(f'<li><a href="/wiki/Portal_{number}">Portal {number}</a></li>' for number in range(40))
+
+    pages = []
+    for number in range(number_of_pages):
+        page_fragments = fragments[number * 12:(number + 1) * 12]
+        title = f"Ysera {number}"
+        paragraphs = "".join(f"<p>{fragment}</p>\n" for fragment in page_fragments[:8])
+        lists = "".join(f"<ul><li>{fragment}</li></ul>\n" for fragment in page_fragments[8:])
+        pages.append(f'<!DOCTYPE html><html><head><title>{title} - Warcraft Wiki</title>'
+                     f'<script>var wgRequestId="{number}";</script></head><body>'
+                     f'<nav><ul>{navigation}</ul></nav><main><h1 id="firstHeading" class="firstHeading">'
+                     f'<span class="mw-page-title-main">{title}</span></h1>\n{paragraphs}{lists}</main>'
+                     f'<footer><a href="/wiki/Warcraft_Wiki:About">About</a></footer></body></html>')
+    return pages
+
+
+# Runs clean function over all fragments repeat times and returns fragments per second of the best run
+# @param clean <function>: cleaning function taking one fragment
+# @param fragments <list>: fragments to clean
+# @param repeat <int>: number of runs
+def measure(clean, fragments, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for fragment in fragments:
+            clean(fragment)
+        best = min(best, time.perf_counter() - start)
+    return len(fragments) / best
+
+
+# Compares throughput of the fused cleaning engine with the sequential cleaning methods and checks their outputs
+# are identical; uses paragraphs and lists of the crawled pages if a page store path is given, synthetic ones otherwise
+if __name__ == "__main__":
+    parser = Parser()
+
+    if len(sys.argv) > 1 and os.path.exists(sys.argv[1]):
+        fragments = []
+        for _, document in PageStore(sys.argv[1]).iter_pages():
+            fragments += parser.get_paragraphs(document) + parser.get_html_list_text(document)
+    else:
+        fragments = generate_fragments(20000)
+
+    mismatches = sum(legacy_clean(parser, fragment) != parser.clean_html_text(fragment) for fragment in fragments)
+    print(f"Fragments: {len(fragments)}, outputs differing from the sequential methods: {mismatches}")
+
+    legacy_throughput = measure(lambda fragment: legacy_clean(parser, fragment), fragments)
+    engine_throughput = measure(parser.clean_html_text, fragments)
+    print(f"Sequential methods: {legacy_throughput:.0f} fragments/s")
+    print(f"Cleaning engine:    {engine_throughput:.0f} fragments/s ({engine_throughput / legacy_throughput:.2f}x)")
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Query cache class -> thread-safe LRU cache whose entries also expire after ttl seconds; the cache belongs to one
+# generation of the index, moving it to a newer generation drops all entries; the generation never moves back and
+# get and put of another generation miss, so results of an older commit are never returned nor cached again
+class QueryCache:
+    # Constructor
+    # @param max_entries <int>: maximal number of cached entries, the least recently used are evicted; 0 disables caching
+    # @param ttl <float>: number of seconds an entry stays valid; None keeps entries until evicted or invalidated
+    def __init__(self, max_entries=1024, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # Returns cached value for the key, or None if it isn't cached, has expired or the cache belongs to another
+    # generation than the one of the caller
+    # @param key <tuple>: hashable key; e.g. ("AND", (("Title", "Illidan"),), 10)
+    # @param generation <int>: index generation of the caller; None reads the entry regardless of the generation
+    def get(self, key, generation=None):
+        with self.lock:
+            entry = self.entries.get(key) if generation is None or generation == self.generation else None
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    # Caches value under the key
+    # @param key <tuple>: hashable key
+    # @param value <object>: cached value, it must not be modified afterwards
+    # @param generation <int>: index generation the value was computed from; the value is dropped if the cache has
+    #                          moved to another generation meanwhile; None caches it regardless of the generation
+    def put(self, key, value, generation=None):
+        if self.max_entries <= 0:
+            return
+
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # Moves the cache to given index generation if it is newer than the current one, dropping all entries; an older
+    # generation, e.g. of a searcher acquired before a refresh, leaves the cache as it is
+    # @param generation <int>: version of the index reader, it grows with every commit; e.g. DirectoryReader.getVersion()
+    def set_generation(self, generation):
+        with self.lock:
+            if self.generation is None or generation > self.generation:
+                self.entries.clear()
+                self.generation = generation
+
+    # Drops all entries
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    # Returns number of hits, misses and cached entries
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
@@ -0,0 +1,38 @@
+import base64
+import hashlib
+import json
+
+
+# Returns short fingerprint of a normalized query, so a cursor can't continue a different query
+# @param query_key <tuple>: normalized query; e.g. ("AND", (("Title", "Ysera"),))
+def fingerprint_query(query_key):
+    return hashlib.sha1(repr(query_key).encode("utf-8")).hexdigest()[:16]
+
+# Returns opaque continuation token pointing after the last returned hit
+# @param version <int>: version of the index the hits come from
+# @param query_key <tuple>: normalized query
+# @param score <float>: score of the last returned hit
+# @param doc <int>: document number of the last returned hit
+# @param rank <int>: rank of the last returned hit
+def encode_cursor(version, query_key, score, doc, rank):
+    state = [version, fingerprint_query(query_key), score, doc, rank]
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+# Returns (score, doc, rank) of the last hit of the previous page
+# Raises ValueError if the token is malformed, belongs to another query or to another version of the index, whose
+# document numbers may differ
+# @param cursor <str>: token returned with the previous page
+# @param version <int>: version of the index the next page comes from
+# @param query_key <tuple>: normalized query
+def decode_cursor(cursor, version, query_key):
+    try:
+        cursor_version, query_fingerprint, score, doc, rank = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+    if query_fingerprint != fingerprint_query(query_key):
+        raise ValueError("Cursor belongs to another query")
+    if cursor_version != version:
+        raise ValueError("Index has changed since the cursor was issued, the search has to start again")
+
+    return score, doc, rank
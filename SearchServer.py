@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import lucene
+from Indexer import Indexer, Searcher
+
+
+# Search server class -> long-running local HTTP/JSON search service; the JVM is started once and the index is opened
+# once, queries are executed by a pool of worker threads attached to the JVM, which share one Searcher
+#   GET  /search?query=Title:Ysera&mode=AND&k=10
+#   POST /search {"query": "Title:Ysera", "mode": "AND", "k": 10} or {"queries": [{...}, {...}]}
+#   a request with "cursor" (null for the first page) is paginated, its response carries "next_cursor"
+#   GET  /stats
+# Every query gets the time left until the request's deadline and Lucene stops it once that time is up, so a timed
+# out request doesn't leave its queries running in the workers
+class SearchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Constructor
+    # @param index_directory <str>: directory with the index; e.g. "index"
+    # @param host <str>: address the server listens on; e.g. "127.0.0.1"
+    # @param port <int>: port the server listens on; e.g. 8080
+    # @param num_workers <int>: number of threads executing the queries
+    # @param request_timeout <float>: seconds after which a request is answered with 504
+    # @param max_batch_size <int>: maximal number of queries in one request
+    def __init__(self, index_directory="index", host="127.0.0.1", port=8080, num_workers=os.cpu_count(),
+                 request_timeout=5.0, max_batch_size=100):
+        Indexer.init_jvm()
+        self.searcher = Searcher(index_directory)
+        self.executor = ThreadPoolExecutor(num_workers, initializer=Indexer.attach_current_thread)
+        self.request_timeout = request_timeout
+        self.max_batch_size = max_batch_size
+        super().__init__((host, port), SearchRequestHandler)
+
+    # Executes one query, called by the worker threads; raises TimeoutError if the deadline passes first
+    # @param request <dict>: query, mode ("AND" or "OR") and k; e.g. {"query": "Title:Ysera", "mode": "AND", "k": 10}
+    # @param deadline <float>: time.monotonic() by which the query has to finish
+    def execute_query(self, request, deadline):
+        start_time = time.perf_counter()
+        query = request.get("query", "") if isinstance(request, dict) else ""
+        response = {"query": query}
+        try:
+            number_of_results = int(request.get("k", 10))
+            mode = "OR" if request.get("mode", "AND").upper() == "OR" else "AND"
+            timeout = deadline - time.monotonic()
+            if "cursor" in request:
+                results, response["next_cursor"] = self.searcher.search_page(query, number_of_results, mode,
+                                                                             request["cursor"], timeout)
+            elif mode == "OR":
+                results = self.searcher.search_documents_or(query, number_of_results, timeout)
+            else:
+                results = self.searcher.search_documents_and(query, number_of_results, timeout)
+        except (ValueError, TypeError, AttributeError, lucene.JavaError) as error:
+            return {"query": query, "error": str(error)}
+
+        response["results"] = [{"rank": rank, "title": title, "score": score} for rank, title, score in results or []]
+        response["took_ms"] = (time.perf_counter() - start_time) * 1000
+        return response
+
+    # Executes queries of a request in parallel and waits for them until the request timeout; raises TimeoutError if
+    # any query doesn't finish in time, queries still waiting for a worker are cancelled
+    # @param requests <list>: queries of the request
+    # @return <list>: responses in the order of the queries
+    def execute_batch(self, requests):
+        deadline = time.monotonic() + self.request_timeout
+        futures = [self.executor.submit(self.execute_query, request, deadline) for request in requests]
+        try:
+            return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    # Stops the server and its workers
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self.searcher.close()
+
+
+# Request handler class -> parses HTTP requests and hands the queries to the search server
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    # Seconds to wait for the client to send the request
+    timeout = 10
+
+    # Sends JSON response
+    # @param status <int>: HTTP status code
+    # @param body <object>: JSON-serializable body
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Answers queries of a request
+    # @param requests <list>: queries of the request
+    # @param batch <bool>: the queries came as a batch, the response is a list
+    def answer(self, requests, batch):
+        if not requests or len(requests) > self.server.max_batch_size:
+            self.send_json(400, {"error": f"Expected 1 to {self.server.max_batch_size} queries"})
+            return
+
+        # Before Python 3.11 the futures' TimeoutError differs from the one raised by the searcher
+        try:
+            responses = self.server.execute_batch(requests)
+        except (TimeoutError, FutureTimeoutError):
+            self.send_json(504, {"error": f"Request timed out after {self.server.request_timeout}s"})
+            return
+
+        if batch:
+            self.send_json(200, {"responses": responses})
+        else:
+            self.send_json(400 if "error" in responses[0] else 200, responses[0])
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            self.send_json(200, self.server.searcher.cache_stats())
+        elif url.path == "/search":
+            parameters = {name: values[0] for name, values in parse_qs(url.query).items()}
+            self.answer([parameters], batch=False)
+        else:
+            self.send_json(404, {"error": "Unknown path"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/search":
+            self.send_json(404, {"error": "Unknown path"})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "Invalid JSON"})
+            return
+
+        if not isinstance(body, dict):
+            self.send_json(400, {"error": "Expected a JSON object"})
+        elif "queries" in body:
+            queries = body["queries"]
+            if isinstance(queries, list):
+                self.answer(queries, batch=True)
+            else:
+                self.send_json(400, {"error": "Expected \"queries\" to be a JSON array"})
+        else:
+            self.answer([body], batch=False)
+
+    # Request logging is left to the load generator, logging every query would dominate the latency
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    # Usage: python SearchServer.py [index_directory] [port] [num_workers]
+    index_directory = sys.argv[1] if len(sys.argv) > 1 else "index"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+    num_workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    server = SearchServer(index_directory, port=port, num_workers=num_workers)
+    print(f"Serving {index_directory} on http://127.0.0.1:{port}/search with {num_workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,22 +1,36 @@
 import unittest
-import csv
-import sys
+import math
+import os
+import random
+import re
 import tempfile
-from Indexer import Indexer
+from BM25Index import BM25Index
+from CorpusStore import CorpusReader, CorpusWriter
+from EntityMatcher import EntityMatcher
+from PageStore import PageStore
+from QueryCache import QueryCache
+from Parser import Parser
+
+try:
+    from Indexer import Indexer, LEGACY_SCHEMA
+except ImportError:
+    Indexer = None
 
 # This class creates unit-test for searching, including multiple problematic scenarios
+@unittest.skipIf(Indexer is None, "PyLucene is not installed")
 class TestIndexer(unittest.TestCase):
 
-    # Sets up the indexer used in tests
-    def setUp(self):
-        csv.field_size_limit(sys.maxsize)
-        self.indexer = Indexer()
-        self.temp_dir = tempfile.TemporaryDirectory()
-        self.indexer.index_data('merged.tsv')
+    # Sets up the indexer used in tests, the index is built once for all tests as none of them modifies it
+    @classmethod
+    def setUpClass(cls):
+        cls.indexer = Indexer(schema=LEGACY_SCHEMA)
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.indexer.index_data('merged.arrow')
 
     # Cleaning after testing
-    def tearDown(self):
-        self.temp_dir.cleanup()
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
 
     # Unit test for query containing one attribute using OR searching function
     def test_search_documents_or_single_query(self):
@@ -108,6 +122,287 @@ class TestIndexer(unittest.TestCase):
         expected_result = None
         self.assertEqual(result, expected_result)
 
+    # Unit test for paging through results with cursors, pages together give the same results as one search
+    def test_search_page_cursor(self):
+        query = "Title:Sarkareth OR Wiki:Aberrus"
+        expected_result = self.indexer.search_documents_or(query, 5)
+        first_page, cursor = self.indexer.get_searcher().search_page(query, 2, mode="OR")
+        second_page, cursor = self.indexer.get_searcher().search_page(query, 3, mode="OR", cursor=cursor)
+        self.assertEqual(first_page + second_page, expected_result)
+        self.assertEqual(list(self.indexer.get_searcher().iter_hits(query, mode="OR"))[:5], expected_result)
+
+    # Unit test for repeating a query with different spacing, the repeated query is answered from the result cache
+    def test_search_documents_and_repeated_query_is_cached(self):
+        query = "Title:Sarkareth AND Paragraphs_content:Aberrus"
+        number_of_results = 3
+        searcher = self.indexer.get_searcher()
+        searcher.result_cache.clear()
+        hits = searcher.cache_stats()["results"]["hits"]
+        first_result = self.indexer.search_documents_and(query, number_of_results)
+        second_result = self.indexer.search_documents_and("Title:Sarkareth  AND Paragraphs_content: Aberrus",
+                                                          number_of_results)
+        self.assertEqual(second_result, first_result)
+        self.assertEqual(searcher.cache_stats()["results"]["hits"], hits + 1)
+
+
+# This class creates unit-test for searching with the BM25 backend over a small synthetic corpus
+class TestBM25Index(unittest.TestCase):
+
+    # Builds the index of the synthetic corpus once for all tests
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        corpus_path = os.path.join(cls.temp_dir.name, "merged.arrow")
+        with CorpusWriter(corpus_path, ["Title", "Paragraphs_content", "Lists_content"]) as writer:
+            writer.write_rows([
+                ("Ysera", "Ysera is the green dragon aspect", "Eye of Ysera"),
+                ("Scalecommander Sarkareth", "Sarkareth leads the Aberrus raid", "Loot"),
+                ("Mythic: Scalecommander Sarkareth", "Sarkareth in Aberrus on mythic", ""),
+                ("Aberrus Approach", "Approach to Aberrus the shadowed crucible", "Loot Loot"),
+                ("Illidan", "Illidan the betrayer wields fel fel", ""),
+            ])
+        BM25Index.build(corpus_path, os.path.join(cls.temp_dir.name, "bm25_index"))
+        cls.index = BM25Index(os.path.join(cls.temp_dir.name, "bm25_index"))
+
+    # Cleaning after testing
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    # Unit test for the score of a single term, computed by Lucene's BM25 formula
+    def test_search_documents_and_single_query(self):
+        query = "Title:Ysera"
+        number_of_results = 1
+        result = self.index.search_documents_and(query, number_of_results)
+        idf = math.log(1 + (5 - 1 + 0.5) / (1 + 0.5))
+        expected_score = idf / (1 + 1.2 * (1 - 0.75 + 0.75 * 1 / (9 / 5)))
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0][:2], (1, 'Ysera'))
+        self.assertAlmostEqual(result[0][2], expected_score, places=6)
+
+    # Unit test for multiple results of multiple attribute query using OR searching function
+    def test_search_documents_or_more_results(self):
+        query = "Title:Sarkareth OR Paragraphs_content:Aberrus"
+        number_of_results = 5
+        result = self.index.search_documents_or(query, number_of_results)
+        self.assertEqual([title for _, title, _ in result],
+                         ['Scalecommander Sarkareth', 'Mythic: Scalecommander Sarkareth', 'Aberrus Approach'])
+
+    # Unit test for AND searching function, documents have to match every clause
+    def test_search_documents_and_multiple_query(self):
+        query = "Paragraphs_content:Aberrus AND Lists_content:Loot"
+        number_of_results = 5
+        result = self.index.search_documents_and(query, number_of_results)
+        self.assertEqual([title for _, title, _ in result], ['Aberrus Approach', 'Scalecommander Sarkareth'])
+
+    # Unit test for documents with equal scores, they are ranked in the order of the corpus
+    def test_search_documents_or_ties(self):
+        query = "Paragraphs_content:Sarkareth"
+        number_of_results = 2
+        result = self.index.search_documents_or(query, number_of_results)
+        self.assertEqual([title for _, title, _ in result],
+                         ['Scalecommander Sarkareth', 'Mythic: Scalecommander Sarkareth'])
+        self.assertEqual(result[0][2], result[1][2])
+        self.assertEqual(self.index.search_documents_or(query, 1), result[:1])
+
+    # Unit test for inputting negative number of wanted documents and empty query
+    def test_search_documents_negative_number_of_documents_and_empty_query(self):
+        self.assertIsNone(self.index.search_documents_or("Title:Aberrus", -1))
+        self.assertIsNone(self.index.search_documents_and("", 1))
+        self.assertEqual(self.index.search_documents_or("Title:Deathwing", 1), [])
+
+    # Unit test for paging through results with cursors, pages together give the same results as one search
+    def test_search_page_cursor(self):
+        query = "Title:Sarkareth OR Paragraphs_content:Aberrus OR Lists_content:Loot"
+        expected_result = self.index.search_documents_or(query, 10)
+        pages, cursor = [], None
+        while True:
+            page, cursor = self.index.search_page(query, 2, mode="OR", cursor=cursor)
+            pages += page
+            if cursor is None:
+                break
+        self.assertEqual(pages, expected_result)
+        self.assertEqual(list(self.index.iter_hits(query, mode="OR")), expected_result)
+
+        _, cursor = self.index.search_page(query, 1, mode="OR")
+        with self.assertRaises(ValueError):
+            self.index.search_page("Title:Ysera", 1, mode="OR", cursor=cursor)
+
+
+# This class creates unit-test for the result cache shared by the searching threads
+class TestQueryCache(unittest.TestCase):
+
+    # Unit test for a thread still searching an older generation after a refresh, it neither moves the cache back nor
+    # reads or caches results of its generation
+    def test_older_generation_is_ignored(self):
+        cache = QueryCache(max_entries=10, ttl=None)
+        cache.set_generation(1)
+        cache.put("Title:Ysera", "old", 1)
+        cache.set_generation(2)
+        self.assertIsNone(cache.get("Title:Ysera", 2))
+        cache.put("Title:Ysera", "new", 2)
+
+        cache.set_generation(1)
+        self.assertIsNone(cache.get("Title:Ysera", 1))
+        cache.put("Title:Ysera", "old", 1)
+        self.assertEqual(cache.get("Title:Ysera", 2), "new")
+        self.assertEqual(cache.stats()["entries"], 1)
+
+
+# This class creates unit-test for reading the corpus file
+class TestCorpusReader(unittest.TestCase):
+
+    # Unit test for reading columns in another order than they are stored, rows follow the requested order
+    def test_iter_rows_columns_out_of_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            corpus_path = os.path.join(temp_dir, "merged.arrow")
+            with CorpusWriter(corpus_path, ["Title", "Paragraphs_content", "Wiki"]) as writer:
+                writer.write_rows([("Ysera", "green dragon", "Emerald Dream"), ("Illidan", "demon hunter", "fel")])
+
+            with CorpusReader(corpus_path) as reader:
+                self.assertEqual(list(reader.iter_rows(["Wiki", "Title"])),
+                                 [("Emerald Dream", "Ysera"), ("fel", "Illidan")])
+                self.assertEqual([batch.schema.names for batch in reader.iter_batches(["Wiki", "Title"])],
+                                 [["Wiki", "Title"]])
+                self.assertEqual(reader.read_column("Wiki").to_pylist(), ["Emerald Dream", "fel"])
+
+    # Unit test for building the BM25 index with the title not as the first column, titles and fields stay matched
+    def test_bm25_build_columns_out_of_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            corpus_path = os.path.join(temp_dir, "merged.arrow")
+            with CorpusWriter(corpus_path, ["Title", "Paragraphs_content", "Wiki"]) as writer:
+                writer.write_rows([("Ysera", "green dragon", "Emerald Dream"), ("Illidan", "demon hunter", "fel")])
+
+            BM25Index.build(corpus_path, os.path.join(temp_dir, "bm25_index"), columns=["Wiki", "Title"])
+            index = BM25Index(os.path.join(temp_dir, "bm25_index"))
+            self.assertEqual([title for _, title, _ in index.search_documents_or("Title:Illidan", 5)], ["Illidan"])
+            self.assertEqual([title for _, title, _ in index.search_documents_or("Wiki:fel", 5)], ["Illidan"])
+
+
+# This class creates unit-test for the page store of the crawler
+class TestPageStore(unittest.TestCase):
+
+    # Unit test for reopening a store whose index ends with a line cut short by a crash, the line is dropped and
+    # pages appended later are readable
+    def test_torn_index_line(self):
+        with tempfile.TemporaryDirectory() as store_path:
+            store = PageStore(store_path)
+            store.put("Ysera_0", "/wiki/Ysera", "Ysera", "<p>Ysera</p>")
+            store.put("Illidan_1", "/wiki/Illidan", "Illidan", "<p>Illidan</p>")
+            store.close()
+            index_path = os.path.join(store_path, "index.tsv")
+            with open(index_path, "rb") as index_file:
+                index = index_file.read()
+            with open(index_path, "wb") as index_file:
+                index_file.write(index[:-10])
+
+            store = PageStore(store_path)
+            self.assertEqual(list(store.entries), ["Ysera_0"])
+            store.put("Sarkareth_2", "/wiki/Sarkareth", "Sarkareth", "<p>Sarkareth</p>")
+            store.close()
+
+            store = PageStore(store_path)
+            self.assertEqual(store.get_by_title("Ysera"), "<p>Ysera</p>")
+            self.assertEqual(store.get_by_url("/wiki/Sarkareth"), "<p>Sarkareth</p>")
+            self.assertNotIn("Illidan_1", store)
+
+
+# This class creates unit-test for removing nested wiki markup, compared with the repeated regex substitution the
+# stack-based scans replaced
+class TestParserWikiMarkup(unittest.TestCase):
+
+    # Removes innermost "{...}" groups until nothing changes, as Parser did before the stack-based scan
+    @staticmethod
+    def remove_curly_brackets_with_subn(document):
+        n = 1
+        while n:
+            document, n = re.subn(r'\{[^{}]*\}', '', document)
+        return document
+
+    # Creates the parser used in tests
+    @classmethod
+    def setUpClass(cls):
+        cls.parser = Parser()
+
+    # Unit test for unbalanced, nested caption and blockquote templates, the output equals the old substitution loop
+    def test_remove_text_between_nested_curly_brackets_cases(self):
+        documents = ["Ysera {{Infobox|name=Ysera|{{color|green|Aspect}}}} the Dreamer",
+                     "{{a}", "a}}{", "}{", "{{{{x}}", "{{x}}}}", "{a{b}c{d{e}}f} g } h {",
+                     "[[File:Ysera.jpg|thumb|{{caption|The {{color|green|Aspect}} of [[Emerald Dream]]}}]] text",
+                     "x {{blockquote|I am {{color|green|Ysera}}|Ysera}} y {{blockquote|unclosed",
+                     ""]
+        for document in documents:
+            self.assertEqual(self.parser.remove_text_between_nested_curly_brackets(document),
+                             self.remove_curly_brackets_with_subn(document), document)
+
+    # Unit test for random documents of brackets and text, the output equals the old substitution loop
+    def test_remove_text_between_nested_curly_brackets_random(self):
+        generator = random.Random(7)
+        for _ in range(2000):
+            document = "".join(generator.choices("{}{}ab|[]", k=generator.randint(0, 40)))
+            self.assertEqual(self.parser.remove_text_between_nested_curly_brackets(document),
+                             self.remove_curly_brackets_with_subn(document), document)
+
+    # Unit test for file and category tags with links nested in their captions, the tags are removed whole
+    def test_remove_wiki_ctg_file_tags_nested_caption(self):
+        document = "a [[File:Ysera.jpg|thumb|The [[Aspect]] of [[Emerald Dream]]]] b [[Ysera]] [[Category:Dragons]]"
+        self.assertEqual(self.parser.remove_wiki_ctg_file_tags(document), "a  b [[Ysera]] ")
+        self.assertEqual(self.parser.remove_wiki_ctg_file_tags("[[File:Ysera.jpg|[[Aspect]]"),
+                         "[[File:Ysera.jpg|[[Aspect]]")
+
+    # Unit test for blockquotes, every quote keeps its own text and templates nested in it are removed afterwards
+    def test_edit_wiki_blockquotes(self):
+        document = "x {{blockquote|I am {{color|green|Ysera}}|Ysera}} y {{blockquote|Two}} {{cite|z}}"
+        edited = self.parser.edit_wiki_blockquotes(document)
+        self.assertEqual(edited, "x I am {{color|green|Ysera}}|Ysera y Two {{cite|z}}")
+        self.assertEqual(self.parser.remove_text_between_nested_curly_brackets(edited),
+                         self.remove_curly_brackets_with_subn(edited))
+        self.assertEqual(self.parser.remove_text_between_nested_curly_brackets(edited), "x I am |Ysera y Two ")
+        self.assertEqual(self.parser.edit_wiki_blockquotes("{{blockquote|unclosed"), "{{blockquote|unclosed")
+
+
+# This class creates unit-test for matching entities in sentences, compared with searching every entity by regex
+class TestEntityMatcher(unittest.TestCase):
+
+    # Returns indices of entities found by regex, case-insensitive and on word boundaries, the entity taken literally
+    @staticmethod
+    def find_entities_with_regex(entities, sentence):
+        return {index for index, entity in enumerate(entities)
+                if re.search(rf"\b{re.escape(entity.lower())}\b", sentence.lower())}
+
+    # Unit test for regex metacharacters, entities starting or ending with non-word characters and overlapping entities
+    def test_find_entities_cases(self):
+        entities = ["Ysera", "C++", "Ysera (tactics)", "(tactics)", "A.B", "?", "Emerald", "Emerald Dream",
+                    "Dream", "Dreamer", "Mythic:", ":Sarkareth", "Sarkareth", "_x", "Ysera_2"]
+        sentences = ["Ysera the Dreamer guards the Emerald Dream.", "C++ and C+ are languages", "Ysera (tactics)",
+                     "see(tactics) here", "AxB or A.B?", "Why?", "Mythic: Sarkareth", "Mythic:Sarkareth",
+                     "_x x_x Ysera_2", "EMERALD dreams", "ysera's dream", ""]
+        matcher = EntityMatcher(entities)
+        for sentence in sentences:
+            self.assertEqual(matcher.find_entities(sentence), self.find_entities_with_regex(entities, sentence),
+                             sentence)
+
+    # Unit test for random entities and sentences over a small alphabet with word and non-word characters
+    def test_find_entities_random(self):
+        generator = random.Random(11)
+        alphabet = "ab _.+(Ab"
+        for _ in range(300):
+            entities = list(dict.fromkeys("".join(generator.choices(alphabet, k=generator.randint(1, 4)))
+                                          for _ in range(generator.randint(1, 6))))
+            matcher = EntityMatcher(entities)
+            for _ in range(10):
+                sentence = "".join(generator.choices(alphabet, k=generator.randint(0, 20)))
+                self.assertEqual(matcher.find_entities(sentence), self.find_entities_with_regex(entities, sentence),
+                                 (entities, sentence))
+
+    # Unit test for grouping sentences by entity in the order of the entities and the sentences
+    def test_match_sentences(self):
+        matcher = EntityMatcher(["Illidan", "fel"])
+        sentences = ["Illidan uses fel energy.", "Felwood is green.", "Illidan is a demon hunter."]
+        self.assertEqual(matcher.match_sentences(sentences),
+                         {"Illidan": ["Illidan uses fel energy.", "Illidan is a demon hunter."],
+                          "fel": ["Illidan uses fel energy."]})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+import bz2
+import os
+import xml.etree.ElementTree as ElementTree
+from multiprocessing import Pool
+
+
+# Reads the index of a multistream Wikipedia dump and returns (start, end) byte ranges of the compressed blocks
+# containing at least one page whose title contains one of the terms; every line of the index looks like
+# "offset:page_id:title" and pages of one block share the offset of the block
+# @param index_path <str>: path to the index; e.g. "wiki_dump/enwiki-20231101-pages-articles-multistream-index.txt.bz2"
+# @param dump_path <str>: path to the dump; e.g. "wiki_dump/enwiki-20231101-pages-articles-multistream.xml.bz2"
+# @param terms <list>: terms searched for in page titles (case-sensitive); e.g. ["Warcraft"]
+def find_matching_blocks(index_path, dump_path, terms):
+    block_offsets = []
+    matching_offsets = set()
+    with bz2.open(index_path, "rt", encoding="utf-8") as index_file:
+        for line in index_file:
+            offset, _, title = line.rstrip("\n").split(":", 2)
+            offset = int(offset)
+            if not block_offsets or block_offsets[-1] != offset:
+                block_offsets.append(offset)
+            if any(term in title for term in terms):
+                matching_offsets.add(offset)
+
+    # The last block ends at the end of the file, so its range includes the stream closing the root element too
+    block_ends = block_offsets[1:] + [os.path.getsize(dump_path)]
+    return [(start, end) for start, end in zip(block_offsets, block_ends) if start in matching_offsets]
+
+
+# Decompresses one block of the dump and returns (title, text) of its pages whose title contains one of the terms;
+# only the first bz2 stream of the range is decompressed, so the last block doesn't get the closing </mediawiki>
+# of the dump's final stream
+# @param dump_path <str>: path to the dump
+# @param block <tuple>: (start, end) byte range of the block
+# @param terms <list>: terms searched for in page titles
+def read_block(dump_path, block, terms):
+    start, end = block
+    with open(dump_path, "rb") as dump_file:
+        dump_file.seek(start)
+        data = bz2.BZ2Decompressor().decompress(dump_file.read(end - start))
+
+    # A block is a sequence of <page> elements without a common root
+    pages = ElementTree.fromstring(b"<pages>" + data + b"</pages>")
+    return [(page.findtext("title"), page.findtext("revision/text") or "")
+            for page in pages.iter("page")
+            if any(term in (page.findtext("title") or "") for term in terms)]
+
+
+# Wiki dump reader class -> streams (title, text) of pages of a multistream Wikipedia dump whose titles contain one of
+# the terms; only compressed blocks holding such pages, found through the dump's index, are read, decompressed and
+# parsed, in parallel by a pool of processes, without loading the rest of the dump
+class WikiDumpReader:
+
+    # Constructor
+    # @param dump_path <str>: path to the dump; e.g. "wiki_dump/enwiki-20231101-pages-articles-multistream.xml.bz2"
+    # @param index_path <str>: path to the index; e.g. "wiki_dump/enwiki-20231101-pages-articles-multistream-index.txt.bz2"
+    # @param terms <list>: terms searched for in page titles; e.g. ["WoW", "World of Warcraft"]
+    # @param processes <int>: number of worker processes; None uses all cores
+    def __init__(self, dump_path, index_path, terms, processes=None):
+        self.dump_path = dump_path
+        self.index_path = index_path
+        self.terms = list(terms)
+        self.processes = processes or os.cpu_count()
+        self.blocks = None
+
+    # Returns byte ranges of the blocks containing matching pages, the index is read only once
+    def get_blocks(self):
+        if self.blocks is None:
+            self.blocks = find_matching_blocks(self.index_path, self.dump_path, self.terms)
+        return self.blocks
+
+    # Reads one block in a worker process
+    # @param block <tuple>: (start, end) byte range of the block
+    def read_block(self, block):
+        return read_block(self.dump_path, block, self.terms)
+
+    # Generator yielding (title, text) of every matching page, in the order of the dump
+    def iter_pages(self):
+        with Pool(self.processes) as pool:
+            for pages in pool.imap(self.read_block, self.get_blocks()):
+                yield from pages
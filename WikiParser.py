@@ -1,26 +1,55 @@
-import csv
-import re
+import functools
+import shutil
+import sys
+import time
+import zlib
+from multiprocessing import Pool
+import pandas as pd
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import col
 from pyspark.sql.functions import explode
 from pyspark.sql.types import StructType, StructField, StringType
 from pyspark.sql.functions import expr
+from pyspark.sql.functions import array_sort, collect_list, regexp_replace, struct
 from Parser import Parser
+from EntityMatcher import EntityMatcher
+from WikiDumpReader import WikiDumpReader
+from CorpusStore import CorpusReader
 import nltk
 from nltk.tokenize import sent_tokenize
 
-csv.field_size_limit(1000000)
 # nltk.download('punkt')
 parser = Parser()
 
 
-# Cleans wiki page using parser, uses NLTK to tokenize text into sentences and searches for occurrences of entities
-# In the end, appends sentences to the entity files
-def process_page(row, keywords, output_directory_path):
-    title = row["title"]
-    content = str(row["_VALUE"])
+# Number of partitions of the output, entities are spread into them by hash
+NUM_OUTPUT_BUCKETS = 64
+
+# Terms to filter pages with
+WOW_RELATED_TERMS = ["WoW", "World of Warcraft", "Warcraft", "Blizzard Entertainment"]
+
+# Schema of (entity, page title, sentences mentioning the entity) records produced by process_page
+ENTITY_PAGE_SCHEMA = StructType([
+    StructField("entity", StringType(), False),
+    StructField("title", StringType(), True),
+    StructField("text", StringType(), False),
+])
+
 
-    # Cleaning
+# Returns NLTK Punkt sentence tokenizer, loaded only once per process instead of on every sent_tokenize call
+# @param language <str>: language of the model; e.g. "english"
+@functools.lru_cache(maxsize=None)
+def get_sentence_tokenizer(language="english"):
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer
+        return PunktTokenizer(language)
+    except ImportError:
+        return nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+
+
+# Cleans wiki page using parser
+# @param content <str>: text of the wiki page
+def clean_wiki_text(content):
     content = parser.remove_html_tags(content)
     content = parser.remove_wiki_citations(content)
     content = parser.edit_wiki_blockquotes(content)
@@ -31,54 +60,178 @@ def process_page(row, keywords, output_directory_path):
     content = content.replace("|", " or ")
     content = parser.remove_wiki_headings(content)
     content = parser.remove_wiki_ctg_file_text(content)
-    content = parser.remove_new_lines(content)
+    return parser.remove_new_lines(content)
+
+
+# Cleans a whole column of wiki pages with the same steps as clean_wiki_text; regex steps run column-wide through
+# pandas string methods, stack-based steps are mapped over the column
+# @param content <Series>: texts of wiki pages
+def clean_wiki_series(content):
+    content = content.str.replace(parser.html_tag_regex, "", regex=True)
+    content = content.str.replace(parser.wiki_citation_regex, "", regex=True)
+    content = content.map(parser.edit_wiki_blockquotes)
+    content = content.map(parser.remove_text_between_nested_curly_brackets)
+    content = content.str.replace(parser.wiki_brackets_apostrophes_regex, "", regex=True)
+    content = content.map(parser.remove_wiki_ctg_file_tags)
+    content = content.str.replace(parser.wiki_links_regex, "", regex=True)
+    content = content.str.replace("|", " or ", regex=False)
+    content = content.str.replace(parser.wiki_headings_regex, "", regex=True)
+    content = content.str.replace(parser.wiki_ctg_file_text_regex, "", regex=True)
+    return content.str.replace(parser.new_line_regex, "", regex=True)
+
+
+# Cleans wiki page using parser, uses NLTK to tokenize text into sentences and searches for occurrences of entities
+# In the end, returns one (entity, page title, sentences joined by space) record for every entity found on the page
+# @param row <Row>: wiki page with "title" and "_VALUE" (text) columns
+# @param matcher <EntityMatcher>: matcher of all entities, built once and broadcast to the executors
+def process_page(row, matcher):
+    title = row["title"]
+    content = clean_wiki_text(str(row["_VALUE"]))
 
     # Tokenizes text into sentences
     sentences = sent_tokenize(content)
 
-    # Will hold entity - sentences like {"Illidan": ["Illidan is a demon hunter.", "He is using fel energy."]}
-    entity_sentences = {}
+    # Searches for all entities in one pass over the sentences; holds entity - sentences like
+    # {"Illidan": ["Illidan is a demon hunter.", "Illidan is using fel energy."]}
+    entity_sentences = matcher.match_sentences(sentences)
+
+    return [(entity, title, " ".join(entity_sentences_list))
+            for entity, entity_sentences_list in entity_sentences.items()]
+
+
+# Batch version of process_page for mapInPandas: receives Arrow record batches of wiki pages as pandas DataFrames,
+# cleans each batch column-wide, splits sentences with the cached tokenizer and yields DataFrames of the entity hits
+# with ENTITY_PAGE_SCHEMA
+# @param batches <iterator>: DataFrames with "title" and "_VALUE" (text) columns
+# @param matcher <EntityMatcher>: matcher of all entities
+def process_page_batches(batches, matcher):
+    tokenizer = get_sentence_tokenizer()
+    for batch in batches:
+        contents = clean_wiki_series(batch["_VALUE"].astype(str))
+
+        entities, titles, texts = [], [], []
+        for title, content in zip(batch["title"], contents):
+            for entity, entity_sentences_list in matcher.match_sentences(tokenizer.tokenize(content)).items():
+                entities.append(entity)
+                titles.append(title)
+                texts.append(" ".join(entity_sentences_list))
+
+        yield pd.DataFrame({"entity": entities, "title": titles, "text": texts})
 
-    # Searches for entities in sentences
-    for entity in keywords:
-        entity_sentence_occurrences = [sentence for sentence in sentences if
-                                       re.search(rf'\b{entity.lower()}\b', sentence.lower())]
 
-        if len(entity_sentence_occurrences):
-            entity_sentences.update({entity: entity_sentence_occurrences})
+# Measures throughput of the row path (process_page over RDD rows) and the batch path (process_page_batches through
+# mapInPandas) on the same pages and prints pages per second per executor core of both
+# @param spark <SparkSession>: spark session
+# @param pages <DataFrame>: wiki pages with "title" and "_VALUE" (text) columns
+# @param matcher <Broadcast>: broadcast EntityMatcher
+def benchmark_processing_paths(spark, pages, matcher):
+    pages = pages.cache()
+    number_of_pages = pages.count()
+    cores = spark.sparkContext.defaultParallelism
 
-    # Saves sentences into corresponding files
-    for entity, entity_sentences_list in entity_sentences.items():
-        entity_filename = re.sub(r"[\*\?\"\|\\\/\:<>]", "", entity, flags=re.I | re.M | re.DOTALL)
-        f_w = open(f"{wiki_output_directory_path}/" + entity_filename + ".txt", "a", encoding="utf-8")
-        f_w.write(f"\n[[{entity}]]\n")
-        f_w.write(" ".join(entity_sentences_list))
-        f_w.close()
+    start_time = time.perf_counter()
+    pages.rdd.flatMap(lambda row: process_page(row, matcher.value)).count()
+    row_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    pages.mapInPandas(lambda batches: process_page_batches(batches, matcher.value), ENTITY_PAGE_SCHEMA).count()
+    batch_time = time.perf_counter() - start_time
+
+    print(f"{number_of_pages} pages on {cores} cores")
+    print(f"Row path:   {number_of_pages / row_time / cores:.2f} pages/s per core")
+    print(f"Batch path: {number_of_pages / batch_time / cores:.2f} pages/s per core ({row_time / batch_time:.2f}x)")
+
+
+# Groups records of process_page by entity into one (entity, wiki) row per entity; sentences of different pages are
+# joined in the order of page titles, so reruns produce the same text; new lines, tabulators and escape return
+# characters are removed; every row also gets the bucket it is written to
+# @param entity_pages <DataFrame>: records with ENTITY_PAGE_SCHEMA
+def group_entity_pages(entity_pages):
+    return (entity_pages
+            .groupBy("entity")
+            .agg(array_sort(collect_list(struct("title", "text"))).alias("pages"))
+            .select(col("entity"),
+                    regexp_replace(expr("concat_ws(' ', transform(pages, page -> page.text))"), "[\n\t\r]", "")
+                    .alias("wiki"),
+                    expr(f"pmod(hash(entity), {NUM_OUTPUT_BUCKETS})").alias("bucket")))
+
+
+# Dump reader and entity matcher of one worker process of the local pool
+worker_reader = None
+worker_matcher = None
+
+
+# Initializes a worker process of the local pool
+# @param reader <WikiDumpReader>: reader of the dump
+# @param matcher <EntityMatcher>: matcher of all entities, built once on the driver
+def init_local_worker(reader, matcher):
+    global worker_reader, worker_matcher
+    worker_reader = reader
+    worker_matcher = matcher
+
+
+# Reads one block of the dump in a worker process and returns records of process_page for all its matching pages
+# @param block <tuple>: (start, end) byte range of the block
+def process_dump_block(block):
+    records = []
+    for title, text in worker_reader.read_block(block):
+        records += process_page({"title": title, "_VALUE": text}, worker_matcher)
+    return records
+
+
+# Runs the whole stage locally without Spark: blocks of the multistream dump holding matching pages are read, cleaned
+# and searched for entities in a pool of processes, records are grouped by entity the same way group_entity_pages
+# does and written as Parquet partitioned by entity bucket, replacing the previous output
+# @param reader <WikiDumpReader>: reader of the dump
+# @param matcher <EntityMatcher>: matcher of all entities
+# @param output_directory_path <str>: output directory; e.g. "wiki_parsed"
+def parse_dump_locally(reader, matcher, output_directory_path):
+    entity_pages = {}
+    with Pool(reader.processes, initializer=init_local_worker, initargs=(reader, matcher)) as pool:
+        for records in pool.imap(process_dump_block, reader.get_blocks()):
+            for entity, title, text in records:
+                entity_pages.setdefault(entity, []).append((title or "", text))
+
+    rows = []
+    for entity, pages in entity_pages.items():
+        wiki_text = " ".join(text for _, text in sorted(pages))
+        wiki_text = wiki_text.replace("\n", "").replace("\t", "").replace("\r", "")
+        rows.append((entity, wiki_text, zlib.crc32(entity.encode("utf-8")) % NUM_OUTPUT_BUCKETS))
+
+    shutil.rmtree(output_directory_path, ignore_errors=True)
+    pd.DataFrame(rows, columns=["entity", "wiki", "bucket"]).to_parquet(output_directory_path,
+                                                                       partition_cols=["bucket"], index=False)
 
 
 if __name__ == "__main__":
 
-    parsed_data_file_path = "parsed.tsv"
+    parsed_data_file_path = "parsed.arrow"
     wiki_output_directory_path = "wiki_parsed"
+    wiki_dump_path = "wiki_dump/enwiki-20231101-pages-articles-multistream.xml"
 
-    # Creates a list of entities to be searched for
-    entities = []
-    with open(parsed_data_file_path, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file, delimiter='\t')
+    # Creates a list of entities to be searched for, only the title column is read
+    with CorpusReader(parsed_data_file_path) as reader:
+        entities = reader.read_column("Title").to_pylist()
 
-        for row in reader:
-            entities.append(row[0])
+    # "--local" reads the compressed multistream dump through its index in a local pool of processes, without Spark
+    if "--local" in sys.argv:
+        dump_reader = WikiDumpReader(f"{wiki_dump_path}.bz2",
+                                     "wiki_dump/enwiki-20231101-pages-articles-multistream-index.txt.bz2",
+                                     WOW_RELATED_TERMS)
+        parse_dump_locally(dump_reader, EntityMatcher(entities), wiki_output_directory_path)
+        sys.exit()
 
     # Initiates spark session
-    spark = SparkSession.builder.appName("WikiParser").config("spark.jars.packages",
-                                                              "com.databricks:spark-xml_2.12:0.15.0").getOrCreate()
+    spark = (SparkSession.builder.appName("WikiParser")
+             .config("spark.jars.packages", "com.databricks:spark-xml_2.12:0.15.0")
+             .config("spark.sql.execution.arrow.maxRecordsPerBatch", "256")
+             .getOrCreate())
 
-    # Reads wiki dump
-    df = spark.read.format('xml').options(rowTag='page', charset='UTF-8').load(
-        "wiki_dump/enwiki-20231101-pages-articles-multistream.xml")
+    # Builds the entity matcher once and ships it to every executor only once
+    matcher = spark.sparkContext.broadcast(EntityMatcher(entities))
 
-    # Terms to filter pages with
-    WOW_RELATED_TERMS = ["WoW", "World of Warcraft", "Warcraft", "Blizzard Entertainment"]
+    # Reads wiki dump
+    df = spark.read.format('xml').options(rowTag='page', charset='UTF-8').load(wiki_dump_path)
 
     # Creation of filtering condition
     condition = col("title").contains(WOW_RELATED_TERMS[0])
@@ -94,5 +247,21 @@ if __name__ == "__main__":
     # Creates a dataset made out of title and revision.text text
     df_with_multiword_keyword = df_with_multiword_keyword.select("title", "revision.text._VALUE")
 
-    # For each row, do process_page function
-    df_with_multiword_keyword.foreach(lambda row: process_page(row, entities, wiki_output_directory_path))
\ No newline at end of file
+    # "--benchmark" only compares throughput of the row and batch paths
+    if "--benchmark" in sys.argv:
+        benchmark_processing_paths(spark, df_with_multiword_keyword, matcher)
+        sys.exit()
+
+    # Each page is turned into (entity, title, sentences) records, which are grouped by entity and written at once
+    # as Parquet partitioned by entity bucket; the output directory is overwritten, so the stage can be rerun;
+    # "--batch" processes Arrow batches of pages with pandas instead of single rows
+    if "--batch" in sys.argv:
+        entity_pages = df_with_multiword_keyword.mapInPandas(
+            lambda batches: process_page_batches(batches, matcher.value), ENTITY_PAGE_SCHEMA)
+    else:
+        entity_pages = spark.createDataFrame(
+            df_with_multiword_keyword.rdd.flatMap(lambda row: process_page(row, matcher.value)), ENTITY_PAGE_SCHEMA)
+    (group_entity_pages(entity_pages)
+     .write.mode("overwrite")
+     .partitionBy("bucket")
+     .parquet(wiki_output_directory_path))
\ No newline at end of file